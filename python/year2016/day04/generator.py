@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import random
+import string
+from collections import Counter
+from typing import Iterator
+
+from support import generator_main
+
+
+def _checksum(name: str) -> str:
+    counts = Counter(name.replace("-", ""))
+    return "".join(sorted(counts, key=lambda c: (-counts[c], c))[:5])
+
+
+def _shift(word: str, k: int) -> str:
+    return "".join(chr((ord(c) - ord("a") + k) % 26 + ord("a")) for c in word)
+
+
+def generate(
+    size: int, seed: int = 0, target: str | None = "northpole object storage"
+) -> Iterator[str]:
+    """Yields room lines until about `size` bytes were produced
+
+    About half the rooms are real. Unless `target` is None, one real room whose
+    name decrypts to it is placed at a random position.
+    """
+    rng = random.Random(seed)
+    # Rooms average a little over 30 bytes
+    target_line = rng.randrange(max(size // 30, 1)) if target else -1
+    total = 0
+    line_no = 0
+
+    while total < size or line_no <= target_line:
+        sector_id = rng.randint(100, 999)
+        if line_no == target_line:
+            assert target is not None
+            words = [_shift(word, -sector_id) for word in target.split()]
+            valid = True
+        else:
+            words = [
+                "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+                for _ in range(rng.randint(1, 5))
+            ]
+            valid = rng.random() < 0.5
+
+        name = "-".join(words)
+        if valid:
+            check = _checksum(name)
+        else:
+            check = "".join(rng.sample(string.ascii_lowercase, 5))
+
+        line = f"{name}-{sector_id}[{check}]\n"
+        total += len(line)
+        line_no += 1
+        yield line
+
+
+if __name__ == "__main__":
+    raise SystemExit(generator_main(generate))
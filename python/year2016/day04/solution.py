@@ -1,13 +1,24 @@
 from __future__ import annotations
 
+import argparse
 import re
+import string
+import time
 from collections import Counter
 from typing import Hashable
 from typing import NamedTuple
 
+import pytest
+
 from support import get_input_data
+from support import import_sibling
+
+generator = import_sibling(__file__, "generator")
 
 regex = re.compile(r"(?P<name>(([a-z]+)-)+)(?P<sector_id>\d+)\[(?P<checksum>[a-z]+)]")
+rooms_regex = re.compile(r"^([a-z-]+)-(\d+)\[([a-z]+)]\r?$", re.MULTILINE)
+
+TARGET_NAME = "northpoleobjectstorage"
 
 
 def invert_counter(c: Counter[Hashable]) -> dict[int, set[Hashable]]:
@@ -44,7 +55,30 @@ def is_room_decoy(room: Room) -> bool:
     return any(a != b for a, b in zip(room.checksum, ordered_chars))
 
 
+# One translation table per shift class, a shift by sector id == sector id % 26
+SHIFT_TABLES = tuple(
+    str.maketrans(
+        string.ascii_lowercase,
+        string.ascii_lowercase[k:] + string.ascii_lowercase[:k],
+    )
+    for k in range(26)
+)
+
+
 def decrypt(name: str, sector_id: int) -> str:
+    return name.translate(SHIFT_TABLES[sector_id % 26])
+
+
+def encrypt(name: str, sector_id: int) -> str:
+    return name.translate(SHIFT_TABLES[-sector_id % 26])
+
+
+def encrypted_names(name: str) -> dict[str, int]:
+    """Maps each possible encryption of `name` to its shift class"""
+    return {encrypt(name, k): k for k in range(26)}
+
+
+def _decrypt_per_char(name: str, sector_id: int) -> str:
     base = ord("a")
     decrypted = []
     for c in name:
@@ -57,6 +91,51 @@ def decrypt(name: str, sector_id: int) -> str:
     return "".join(decrypted)
 
 
+class RoomReport(NamedTuple):
+    sector_sum: int
+    target_sector_id: int | None
+    valid: list[bool]
+
+
+LETTER_INDEX = {c: i for i, c in enumerate(string.ascii_lowercase)}
+
+
+def checksum(name: str, length: int = 5) -> str:
+    # Packs (-count, letter) into one int, so ordering needs no key function
+    keys = sorted([LETTER_INDEX[c] - (name.count(c) << 5) for c in set(name)])
+    return "".join(string.ascii_lowercase[k & 31] for k in keys[:length])
+
+
+def analyze_rooms(s: str, target: str = TARGET_NAME) -> RoomReport:
+    """Validates every room and looks for `target` in a single pass over `s`
+
+    Raises ValueError if any line of `s` is not a room.
+    """
+    sector_sum = 0
+    target_sector_id = None
+    valid = []
+    # Encrypt the target once per shift class instead of decrypting every room
+    targets = encrypted_names(target)
+
+    for match in rooms_regex.finditer(s):
+        name, sector_id_s, expected = match.groups()
+        sector_id = int(sector_id_s)
+        name = name.replace("-", "")
+
+        is_valid = checksum(name, len(expected)) == expected
+        valid.append(is_valid)
+        if is_valid:
+            sector_sum += sector_id
+        if target_sector_id is None and targets.get(name) == sector_id % 26:
+            target_sector_id = sector_id
+
+    lines = s.count("\n") + (bool(s) and not s.endswith("\n"))
+    if len(valid) != lines:
+        raise ValueError(f"Only {len(valid)} of {lines} lines are rooms")
+
+    return RoomReport(sector_sum, target_sector_id, valid)
+
+
 INPUT_S = """\
 aaaaa-bbb-z-y-x-123[abxyz]
 a-b-c-d-e-f-g-h-987[abcde]
@@ -66,22 +145,32 @@ totally-real-room-200[decoy]
 
 
 def part1(s: str) -> str | int:
-    return sum(
-        r.sector_id
-        for line in s.splitlines()
-        if not is_room_decoy(r := parse_room(line))
-    )
+    return analyze_rooms(s).sector_sum
 
 
 def part2(s: str) -> str | int:
-    room_with_objects = [
-        r
-        for line in s.splitlines()
-        if decrypt((r := parse_room(line)).name.replace("-", ""), r.sector_id)
-        == "northpoleobjectstorage"
-    ]
+    sector_id = analyze_rooms(s).target_sector_id
+    if sector_id is None:
+        raise ValueError("Not found")
+
+    return sector_id
+
 
-    return room_with_objects[0].sector_id
+def benchmark(size: int = 32_000_000) -> None:
+    data = "".join(generator.generate(size))
+
+    # The original part1/part2: two passes, every room re-parsed and decrypted
+    before = time.perf_counter()
+    for line in data.splitlines():
+        is_room_decoy(parse_room(line))
+    for line in data.splitlines():
+        r = parse_room(line)
+        _decrypt_per_char(r.name.replace("-", ""), r.sector_id)
+    print(f"> per line: {time.perf_counter() - before:.2f} s")
+
+    before = time.perf_counter()
+    analyze_rooms(data)
+    print(f"> batch:    {time.perf_counter() - before:.2f} s")
 
 
 def test_part1():
@@ -92,6 +181,56 @@ def test_decrypt():
     assert decrypt("qzmtzixmtkozyivhz", 343) == "veryencryptedname"
 
 
+def test_encrypt_decrypt() -> None:
+    for sector_id in range(60):
+        encrypted = encrypt("veryencryptedname", sector_id)
+        assert encrypted == _decrypt_per_char("veryencryptedname", -sector_id)
+        assert decrypt(encrypted, sector_id) == "veryencryptedname"
+
+
+def test_analyze_rooms() -> None:
+    sector_id = 343
+    encrypted = "-".join(
+        encrypt(word, sector_id) for word in ("northpole", "object", "storage")
+    )
+    report = analyze_rooms(f"{INPUT_S}{encrypted}-{sector_id}[abcde]\n")
+    assert report == RoomReport(
+        sector_sum=1514,
+        target_sector_id=sector_id,
+        valid=[True, True, True, False, False],
+    )
+
+
+def test_analyze_rooms_line_endings() -> None:
+    expected = analyze_rooms(INPUT_S)
+    assert analyze_rooms(INPUT_S.replace("\n", "\r\n")) == expected
+    assert analyze_rooms(INPUT_S.rstrip("\n")) == expected
+
+
+@pytest.mark.parametrize(
+    "line", ("not-a-room", "a-b-c-123[Abcde]", "", "a-b-c-123[abcde] ")
+)
+def test_analyze_rooms_rejects_other_lines(line: str) -> None:
+    with pytest.raises(ValueError):
+        analyze_rooms(f"{INPUT_S}{line}\n")
+
+
+def test_analyze_rooms_matches_per_room() -> None:
+    data = "".join(generator.generate(16_000, seed=1))
+    expected = [not is_room_decoy(parse_room(line)) for line in data.splitlines()]
+    report = analyze_rooms(data)
+    assert report.valid == expected
+    assert report.target_sector_id is not None
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bench", action="store_true")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark()
+        raise SystemExit(0)
+
     print(part1(get_input_data(2016, 4)))
     print(part2(get_input_data(2016, 4)))
@@ -1,26 +1,158 @@
 from __future__ import annotations
 
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
 from hashlib import md5
 from itertools import count
+from pathlib import Path
 from typing import Generator
 
+import pytest
 
-def get_hashes(door_id: str) -> Generator[str, None, None]:
-    num = count()
-    while True:
-        salted = door_id + str(next(num))
-        digest = md5(salted.encode()).hexdigest()
+from support import HitCache
+
+Hit = tuple[int, str]
+
+PREDICATE = "md5-00000"
+
+
+# Nonces are hashed as `door_id + high + low`, where `low` is always the last
+# three digits (zero padded once `high` is non-zero). Pre-rendering the suffixes
+# means no nonce is ever formatted in the hot loop.
+_LOW_DIGITS = tuple(b"%d" % i for i in range(1000))
+_LOW_DIGITS_PADDED = tuple(b"%03d" % i for i in range(1000))
+
+
+def search_range(door_id: str, start: int, stop: int) -> list[Hit]:
+    """Returns every (nonce, digest) in [start, stop) whose digest starts with 00000"""
+    hits: list[Hit] = []
+    base = md5(door_id.encode())
+
+    while start < stop:
+        high, low = divmod(start, 1000)
+        block_stop = min(stop - high * 1000, 1000)
+        if high:
+            prefix = base.copy()
+            prefix.update(b"%d" % high)
+            suffixes = _LOW_DIGITS_PADDED
+        else:
+            prefix = base
+            suffixes = _LOW_DIGITS
+
+        for i in range(low, block_stop):
+            h = prefix.copy()
+            h.update(suffixes[i])
+            digest = h.digest()
+            # 5 leading hex zeros == 20 leading zero bits
+            if not digest[0] and not digest[1] and digest[2] < 0x10:
+                hits.append((high * 1000 + i, h.hexdigest()))
+
+        start = high * 1000 + block_stop
+
+    return hits
+
+
+def _search_range_naive(door_id: str, start: int, stop: int) -> list[Hit]:
+    hits: list[Hit] = []
+    for n in range(start, stop):
+        digest = md5((door_id + str(n)).encode()).hexdigest()
         if digest.startswith("00000"):
-            yield digest
+            hits.append((n, digest))
+
+    return hits
+
+
+def _scan(
+    door_id: str, workers: int, chunk: int, start: int
+) -> Generator[tuple[int, list[Hit]], None, None]:
+    """Yields (end of chunk, hits in chunk) for consecutive chunks from start"""
+    chunks = count(start, chunk)
+
+    if workers == 1:
+        for lo in chunks:
+            yield lo + chunk, search_range(door_id, lo, lo + chunk)
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending: deque[tuple[int, Future[list[Hit]]]] = deque()
+
+    def submit() -> None:
+        lo = next(chunks)
+        future = executor.submit(search_range, door_id, lo, lo + chunk)
+        pending.append((lo + chunk, future))
+
+    try:
+        # Keep a couple of chunks queued per worker so no core sits idle while
+        # the oldest chunk is being drained
+        for _ in range(workers * 2):
+            submit()
+
+        while True:
+            hi, future = pending.popleft()
+            hits = future.result()
+            submit()
+            yield hi, hits
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_hashes(
+    door_id: str,
+    workers: int | None = None,
+    chunk: int = 100_000,
+    start: int = 0,
+    cache: HitCache | None = None,
+) -> Generator[str, None, None]:
+    """Yields interesting hashes in strict nonce order
+
+    Contiguous ranges of `chunk` nonces are farmed out to `workers` processes
+    (defaults to the number of cores). Results are consumed in submission order,
+    so the output is identical to a serial scan.
+
+    With a `cache`, previously found hits are replayed first and the scan resumes
+    where the last run stopped.
+    """
+    workers = workers or os.cpu_count() or 1
+    hits: list[Hit] = []
+    scanned = 0
+
+    if cache is not None:
+        hits, scanned = cache.load(door_id, PREDICATE)
+        if scanned < start:
+            # Cannot extend the cached range without leaving a gap
+            cache, hits, scanned = None, [], start
 
+    try:
+        for n, digest in hits:
+            if n >= start:
+                yield digest
 
-def parts_1_2() -> tuple[str, str]:
+        for scanned, chunk_hits in _scan(door_id, workers, chunk, max(start, scanned)):
+            if chunk_hits and cache is not None:
+                hits.extend(chunk_hits)
+                cache.store(door_id, PREDICATE, hits, scanned)
+            for _, digest in chunk_hits:
+                yield digest
+    finally:
+        if cache is not None:
+            cache.store(door_id, PREDICATE, hits, scanned)
+
+
+def parts_1_2(
+    door_id: str = "uqwqemis",
+    workers: int | None = None,
+    chunk: int = 100_000,
+    cache: HitCache | None = None,
+) -> tuple[str, str]:
     # Part 1 produces a subset of what Part 2 needs
     positions = {*list(range(8))}
     part1_code: list[str] = []
     part2_code: list[tuple[int, str]] = []
 
-    generator = get_hashes("uqwqemis")
+    generator = get_hashes(door_id, workers=workers, chunk=chunk, cache=cache)
 
     while positions:
         hash_ = next(generator)
@@ -33,10 +165,109 @@ def parts_1_2() -> tuple[str, str]:
             positions.remove(pos)
             part2_code.append((pos, hash_[6]))
 
+    generator.close()
+
     return "".join(part1_code), "".join(c for _, c in sorted(part2_code))
 
 
+def benchmark(door_id: str = "uqwqemis", nonces: int = 1_000_000) -> None:
+    for name, f in (("naive", _search_range_naive), ("prefix", search_range)):
+        before = time.perf_counter()
+        f(door_id, 0, nonces)
+        elapsed = time.perf_counter() - before
+        print(f"> {name:>6}: {nonces / elapsed:,.0f} hashes/s")
+
+
+def test_search_range() -> None:
+    assert search_range("abc", 3231920, 3231930) == [
+        (3231929, "00000155f8105dff7f56ee10fa9b9abd")
+    ]
+
+
+@pytest.mark.parametrize(
+    ("door_id", "expected"),
+    (
+        ("door3925", (153, "000009408c1c7214699bc1a4e89f2b85")),
+        ("door2467", (752, "0000018091369e9d98d5b3c882f49374")),
+        ("door12896", (1095, "000006c7ff8fc81b59e996f2120a8ec8")),
+        ("door3064", (1218, "0000021fbf32ab84acda41f152c54139")),
+    ),
+)
+def test_search_range_nonce_rendering(door_id: str, expected: Hit) -> None:
+    # Hits on either side of the unpadded/padded suffix boundary
+    assert search_range(door_id, 0, 2000) == [expected]
+    assert search_range(door_id, 0, 2000) == _search_range_naive(door_id, 0, 2000)
+
+
+def test_get_hashes_parallel() -> None:
+    hashes = get_hashes("abc", workers=2, chunk=4, start=3231920)
+    assert next(hashes) == "00000155f8105dff7f56ee10fa9b9abd"
+    hashes.close()
+
+
+def test_get_hashes_cache_resume(tmp_path: Path) -> None:
+    cache = HitCache(2016, 5, cache_dir=str(tmp_path))
+    # Pretend an earlier run already scanned everything up to here
+    cache.store("abc", PREDICATE, [], 3231900)
+    hashes = get_hashes("abc", workers=1, chunk=10, cache=cache)
+    assert next(hashes) == "00000155f8105dff7f56ee10fa9b9abd"
+    hashes.close()
+    assert cache.load("abc", PREDICATE) == (
+        [(3231929, "00000155f8105dff7f56ee10fa9b9abd")],
+        3231930,
+    )
+
+    # A fake hit past the scanned range proves the replay comes from the cache
+    cache.store("abc", PREDICATE, [(0, "00000fake")], 10**9)
+    assert next(get_hashes("abc", workers=1, cache=cache)) == "00000fake"
+
+    refreshed = HitCache(2016, 5, cache_dir=str(tmp_path), refresh=True)
+    assert refreshed.load("abc", PREDICATE) == ([], 0)
+
+
+def test_hit_cache_eviction(tmp_path: Path) -> None:
+    cache = HitCache(2016, 5, cache_dir=str(tmp_path), max_entries=2)
+    for door_id in ("a", "b", "c"):
+        cache.store(door_id, PREDICATE, [], 10)
+    assert cache.load("a", PREDICATE) == ([], 0)
+    assert cache.load("c", PREDICATE) == ([], 10)
+
+    cache.invalidate("c")
+    assert cache.load("c", PREDICATE) == ([], 0)
+
+
+def test_hit_cache_load_defers_access(tmp_path: Path) -> None:
+    cache = HitCache(2016, 5, cache_dir=str(tmp_path), max_entries=2)
+    cache.store("a", PREDICATE, [], 10)
+    cache.store("b", PREDICATE, [], 10)
+
+    with open(cache.path) as f:
+        before = f.read()
+    assert cache.load("a", PREDICATE) == ([], 10)
+    with open(cache.path) as f:
+        assert f.read() == before
+
+    # The read of "a" is recorded by this store, so "b" is the one evicted
+    cache.store("c", PREDICATE, [], 10)
+    assert cache.load("a", PREDICATE) == ([], 10)
+    assert cache.load("b", PREDICATE) == ([], 0)
+
+
 if __name__ == "__main__":
-    part1, part2 = parts_1_2()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--refresh-cache", action="store_true")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark()
+        raise SystemExit(0)
+
+    cache = None
+    if not args.no_cache:
+        cache = HitCache(2016, 5, refresh=args.refresh_cache)
+
+    part1, part2 = parts_1_2(cache=cache)
     print(f"Solution part 1: {part1}")
     print(f"Solution part 2: {part2}")
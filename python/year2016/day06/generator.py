@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import random
+import string
+from itertools import accumulate
+from typing import Iterator
+
+from support import generator_main
+
+
+def generate(
+    size: int, seed: int = 0, width: int = 8, batch_size: int = 4096
+) -> Iterator[str]:
+    """Yields signal lines of `width` letters until about `size` bytes were produced
+
+    Each column draws from its own skewed letter distribution, so every column
+    has a distinct most and least common letter once enough lines were drawn.
+    """
+    rng = random.Random(seed)
+    letters = string.ascii_lowercase
+    cum_weights = []
+    for _ in range(width):
+        weights = list(range(1, len(letters) + 1))
+        rng.shuffle(weights)
+        cum_weights.append(list(accumulate(weights)))
+
+    lines = max(size // (width + 1), 1)
+    while lines > 0:
+        n = min(lines, batch_size)
+        columns = [rng.choices(letters, cum_weights=w, k=n) for w in cum_weights]
+        yield from (f"{''.join(row)}\n" for row in zip(*columns))
+        lines -= n
+
+
+if __name__ == "__main__":
+    raise SystemExit(generator_main(generate))
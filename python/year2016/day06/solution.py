@@ -1,9 +1,21 @@
 from __future__ import annotations
 
+import argparse
+import time
 from collections import Counter
+from io import BytesIO
+from io import StringIO
+from typing import IO
 from typing import Iterable
 
+import numpy as np
+import numpy.typing as npt
+import pytest
+
 from support import get_input_data
+from support import import_sibling
+
+generator = import_sibling(__file__, "generator")
 
 
 def get_message(lines: list[str], indexes: Iterable[int]) -> Iterable[str]:
@@ -16,8 +28,139 @@ def get_message(lines: list[str], indexes: Iterable[int]) -> Iterable[str]:
         yield "".join(counter.most_common()[index][0] for counter in counters)
 
 
+def column_histograms(lines: list[str]) -> npt.NDArray[np.int64]:
+    """Returns a (columns, 256) array of per column character counts"""
+    width = len(lines[0])
+    data = np.frombuffer("".join(lines).encode("latin-1"), dtype=np.uint8)
+    if data.size != width * len(lines):
+        raise ValueError("All lines must have the same length")
+
+    # Offset each column into its own 256 slot band so one bincount does it all
+    keys = data.reshape(len(lines), width) + np.arange(0, width * 256, 256)
+    return np.bincount(keys.ravel(), minlength=width * 256).reshape(width, 256)
+
+
+def decode_histograms(
+    counts: npt.NDArray[np.int64], indexes: Iterable[int]
+) -> Iterable[str]:
+    """Yields the message made of the character at each rank, per index
+
+    Ranks follow `Counter.most_common`, i.e. 0 is the most common character and
+    -1 the least common one that occurs at all. Ties are broken by character
+    code rather than by first occurrence.
+    """
+    columns = np.arange(counts.shape[0])
+    present = np.count_nonzero(counts, axis=1)
+    order = np.argsort(-counts, axis=1, kind="stable")
+
+    for index in indexes:
+        ranks = present + index if index < 0 else np.full_like(present, index)
+        if (ranks < 0).any() or (ranks >= present).any():
+            raise IndexError(f"Rank out of range: {index}")
+        yield order[columns, ranks].astype(np.uint8).tobytes().decode("latin-1")
+
+
+def get_message_histogram(lines: list[str], indexes: Iterable[int]) -> Iterable[str]:
+    return decode_histograms(column_histograms(lines), indexes)
+
+
+class SignalDecoder:
+    """Incrementally decodes a signal fed line by line or in raw chunks
+
+    Complete lines are buffered and folded into running per column histograms
+    `batch_size` lines at a time, so the current message for any rank can be
+    reported at any point without re-scanning what was already received. After
+    the last `feed`, call `finish` so an unterminated last line is counted.
+    """
+
+    def __init__(self, batch_size: int = 4096):
+        self._batch_size = batch_size
+        self._counts: npt.NDArray[np.int64] | None = None
+        self._lines: list[str] = []
+        self._partial = ""
+
+    def feed_line(self, line: str) -> None:
+        line = line.rstrip("\r\n")
+        if line:
+            self._lines.append(line)
+        if len(self._lines) >= self._batch_size:
+            self._flush()
+
+    def feed(self, chunk: str | bytes) -> None:
+        """Accepts an arbitrary slice of the signal, lines may span chunks"""
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode("latin-1")
+
+        *lines, self._partial = (self._partial + chunk).split("\n")
+        for line in lines:
+            self.feed_line(line)
+
+    def consume(self, stream: IO[str] | IO[bytes], chunk_size: int = 1 << 16) -> None:
+        """Feeds a whole stream; a last line without a newline is counted too"""
+        while chunk := stream.read(chunk_size):
+            self.feed(chunk)
+        self.finish()
+
+    def finish(self) -> None:
+        """Counts a pending last line that did not end in a newline"""
+        if self._partial:
+            partial, self._partial = self._partial, ""
+            self.feed_line(partial)
+
+    def _flush(self) -> None:
+        if not self._lines:
+            return
+
+        counts = column_histograms(self._lines)
+        self._lines.clear()
+        if self._counts is None:
+            self._counts = counts
+        elif self._counts.shape != counts.shape:
+            raise ValueError("All lines must have the same length")
+        else:
+            self._counts += counts
+
+    def message(self, index: int = 0) -> str:
+        """Returns the current message at rank `index` (0 most, -1 least common)"""
+        self._flush()
+        if self._counts is None:
+            return ""
+        return next(iter(decode_histograms(self._counts, (index,))))
+
+    @property
+    def most_common(self) -> str:
+        return self.message(0)
+
+    @property
+    def least_common(self) -> str:
+        return self.message(-1)
+
+
 def part_1_2(s: str) -> tuple[str, ...]:
-    return tuple(get_message(s.splitlines(), (0, -1)))
+    return tuple(get_message_histogram(s.splitlines(), (0, -1)))
+
+
+def benchmark(max_size: int = 100_000_000) -> None:
+    size = 10_000
+    while size <= max_size:
+        data = "".join(generator.generate(size))
+
+        before = time.perf_counter()
+        part_1_2(data)
+        batch = time.perf_counter() - before
+
+        before = time.perf_counter()
+        decoder = SignalDecoder()
+        for line in generator.generate(size):
+            decoder.feed_line(line)
+        decoder.message(0), decoder.message(-1)
+        streamed = time.perf_counter() - before
+
+        print(
+            f"> {len(data):>11,} bytes batch: {batch * 1000:9.1f} ms"
+            f"  streamed: {streamed * 1000:9.1f} ms"
+        )
+        size *= 10
 
 
 TEST_INPUT = """\
@@ -45,5 +188,79 @@ def test_get_message():
     assert list(actual) == ["easter", "advent"]
 
 
+def test_get_message_histogram() -> None:
+    actual = get_message_histogram(TEST_INPUT.splitlines(), (0, -1))
+    assert list(actual) == ["easter", "advent"]
+
+
+@pytest.mark.parametrize(
+    ("index", "expected"),
+    ((0, "ab"), (1, "bc"), (2, "ca"), (-1, "ca"), (-3, "ab")),
+)
+def test_get_message_histogram_ranks(index: int, expected: str) -> None:
+    lines = ["ab", "ab", "ab", "bc", "bc", "ca"]
+    assert list(get_message_histogram(lines, (index,))) == [expected]
+
+
+def test_get_message_histogram_rank_out_of_range() -> None:
+    with pytest.raises(IndexError):
+        list(get_message_histogram(["ab", "ab", "cd"], (2,)))
+
+
+@pytest.mark.parametrize("chunk_size", (1, 5, 7, 1024))
+@pytest.mark.parametrize("as_bytes", (False, True))
+def test_signal_decoder_feed(chunk_size: int, as_bytes: bool) -> None:
+    decoder = SignalDecoder(batch_size=3)
+    data: str | bytes = TEST_INPUT.encode() if as_bytes else TEST_INPUT
+    for i in range(0, len(data), chunk_size):
+        decoder.feed(data[i : i + chunk_size])
+
+    assert (decoder.most_common, decoder.least_common) == ("easter", "advent")
+
+
+@pytest.mark.parametrize("as_bytes", (False, True))
+def test_signal_decoder_no_trailing_newline(as_bytes: bool) -> None:
+    text = TEST_INPUT.rstrip("\n")
+    stream: IO[str] | IO[bytes] = BytesIO(text.encode()) if as_bytes else StringIO(text)
+    decoder = SignalDecoder(batch_size=3)
+    decoder.consume(stream, chunk_size=5)
+    assert (decoder.most_common, decoder.least_common) == ("easter", "advent")
+
+    decoder = SignalDecoder()
+    decoder.feed(text)
+    decoder.finish()
+    decoder.finish()
+    assert (decoder.most_common, decoder.least_common) == ("easter", "advent")
+
+
+def test_signal_decoder_running_report() -> None:
+    lines = TEST_INPUT.splitlines()
+    decoder = SignalDecoder(batch_size=4)
+    for n, line in enumerate(lines, start=1):
+        decoder.feed_line(line)
+        if n % 5 == 0:
+            expected = list(get_message_histogram(lines[:n], (0, -1)))
+            assert [decoder.most_common, decoder.least_common] == expected
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_generated_signal(seed: int) -> None:
+    decoder = SignalDecoder(batch_size=100)
+    for line in generator.generate(20_000, seed=seed, width=6):
+        decoder.feed_line(line)
+
+    data = "".join(generator.generate(20_000, seed=seed, width=6))
+    assert (decoder.most_common, decoder.least_common) == part_1_2(data)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--max-size", type=int, default=100_000_000)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.max_size)
+        raise SystemExit(0)
+
     print(f"Solution Parts 1 and 2: {part_1_2(get_input_data(2016, 6))}")
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import random
+import string
+from typing import Iterator
+
+from support import generator_main
+
+
+def generate(size: int, seed: int = 0, alphabet: int = 6) -> Iterator[str]:
+    """Yields IPv7 addresses until about `size` bytes were produced
+
+    Letters come from the first `alphabet` letters only, small enough for ABBA
+    and ABA/BAB patterns to occur both inside and outside of brackets.
+    """
+    rng = random.Random(seed)
+    letters = string.ascii_lowercase[:alphabet]
+
+    def segment() -> str:
+        return "".join(rng.choices(letters, k=rng.randint(4, 12)))
+
+    total = 0
+    while total < size:
+        parts = [segment()]
+        for _ in range(rng.randint(1, 3)):
+            parts.append(f"[{segment()}]{segment()}")
+        line = f"{''.join(parts)}\n"
+        total += len(line)
+        yield line
+
+
+if __name__ == "__main__":
+    raise SystemExit(generator_main(generate))
@@ -1,13 +1,26 @@
 from __future__ import annotations
 
+import argparse
+import mmap
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from functools import reduce
+from itertools import repeat
+from pathlib import Path
+from typing import Callable
 from typing import Generator
 from typing import Iterable
+from typing import NamedTuple
 
 import pytest
 from more_itertools.more import windowed
 
-from support import get_input_data
+from support import get_input_path
+from support import import_sibling
+
+generator = import_sibling(__file__, "generator")
 
 
 def is_abba(s: str) -> bool:
@@ -51,7 +64,7 @@ def does_supports_tls(s: str) -> bool:
 
 def get_aba(s: str) -> Iterable[tuple[str, str, str]]:
     for a, b, c in windowed(s, 3):
-        if a == c:
+        if a == c and a != b:
             yield a, b, c
 
 
@@ -73,7 +86,110 @@ def does_support_ssl(s: str) -> bool:
     return len(supernet.intersection(hypernet)) > 0
 
 
+BRACKETS_REGEX = re.compile(r"[\[\]]")
+ABBA_REGEX = re.compile(r"([a-z])(?!\1)([a-z])\2\1")
+# Matches over "supernets|hypernets": an ABA in a supernet, then its BAB after "|"
+ABA_BAB_REGEX = re.compile(r"([a-z])(?!\1)([a-z])\1[^|]*\|.*\2\1\2")
+
+
+def split_ip(s: str) -> tuple[str, str]:
+    """Returns the supernet and the hypernet sequences, each joined with '-'"""
+    parts = BRACKETS_REGEX.split(s)
+    return "-".join(parts[::2]), "-".join(parts[1::2])
+
+
+def classify(s: str) -> tuple[bool, bool]:
+    """Returns whether the address supports TLS and SSL"""
+    supernet, hypernet = split_ip(s)
+    tls = ABBA_REGEX.search(supernet) is not None and not ABBA_REGEX.search(hypernet)
+    ssl = ABA_BAB_REGEX.search(f"{supernet}|{hypernet}") is not None
+    return tls, ssl
+
+
+def supports_tls_fast(s: str) -> bool:
+    return classify(s)[0]
+
+
+def supports_ssl_fast(s: str) -> bool:
+    return classify(s)[1]
+
+
+def count_lines(s: str) -> tuple[int, int, int]:
+    """Returns the (tls, ssl, lines) counts for a block of addresses"""
+    tls_count = ssl_count = lines = 0
+    for tls, ssl in map(classify, s.splitlines()):
+        tls_count += tls
+        ssl_count += ssl
+        lines += 1
+    return tls_count, ssl_count, lines
+
+
 def solve(s: str) -> tuple[int, int]:
+    tls, ssl, _ = count_lines(s)
+    return tls, ssl
+
+
+class ClassifyResult(NamedTuple):
+    tls: int
+    ssl: int
+    lines: int
+    seconds: float
+
+    @property
+    def lines_per_sec(self) -> float:
+        return self.lines / self.seconds if self.seconds else float("inf")
+
+
+def _count_span(path: str, start: int, stop: int) -> tuple[int, int, int]:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        return count_lines(m[start:stop].decode())
+
+
+def _line_spans(m: mmap.mmap, chunk_size: int) -> list[tuple[int, int]]:
+    spans = []
+    start = 0
+    while start < len(m):
+        stop = m.find(b"\n", min(start + chunk_size, len(m)))
+        stop = len(m) if stop == -1 else stop + 1
+        spans.append((start, stop))
+        start = stop
+    return spans
+
+
+def solve_file(
+    path: str,
+    workers: int | None = None,
+    chunk_size: int = 1 << 23,
+    serial_threshold: int = 1 << 24,
+) -> ClassifyResult:
+    """Classifies a file of addresses, splitting it at line boundaries
+
+    Files smaller than `serial_threshold` bytes (or workers=1) are processed in
+    this process, larger ones in chunks of about `chunk_size` bytes across a
+    process pool. Workers map the file themselves, so only offsets are sent.
+    """
+    before = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    if not os.path.getsize(path):
+        return ClassifyResult(0, 0, 0, time.perf_counter() - before)
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        spans = _line_spans(m, chunk_size)
+        serial = workers == 1 or len(m) < serial_threshold or len(spans) == 1
+        if serial:
+            counts = [count_lines(m[a:b].decode()) for a, b in spans]
+
+    if not serial:
+        starts, stops = zip(*spans)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(executor.map(_count_span, repeat(path), starts, stops))
+
+    tls, ssl, lines = (sum(c) for c in zip(*counts))
+    return ClassifyResult(tls, ssl, lines, time.perf_counter() - before)
+
+
+def _solve_reference(s: str) -> tuple[int, int]:
     return reduce(
         lambda acc, e: (acc[0] + does_supports_tls(e), acc[1] + does_support_ssl(e)),
         s.splitlines(),
@@ -81,6 +197,16 @@ def solve(s: str) -> tuple[int, int]:
     )
 
 
+def benchmark(size: int = 64_000_000) -> None:
+    data = "".join(generator.generate(size))
+    n = data.count("\n")
+    for name, f in (("reference", _solve_reference), ("regex", solve)):
+        before = time.perf_counter()
+        f(data)
+        elapsed = time.perf_counter() - before
+        print(f"> {name:>9}: {elapsed:.2f} s ({n / elapsed:,.0f} lines/s)")
+
+
 TEST_INPUT = """\
 abba[mnop]qrst
 abcd[bddb]xyyx
@@ -103,6 +229,7 @@ ioxxoj[asdfgh]zxcvbn
 )
 def test_is_abba(input_s: str, expected: str) -> None:
     assert is_abba(input_s) == expected
+    assert (ABBA_REGEX.search(input_s) is not None) == expected
 
 
 @pytest.mark.parametrize(
@@ -114,8 +241,11 @@ def test_is_abba(input_s: str, expected: str) -> None:
         ("ioxxoj[asdfgh]zxcvbn", True),
     ),
 )
-def test_does_supports_tls(input_s: str, expected: str) -> None:
-    assert does_supports_tls(input_s) == expected
+@pytest.mark.parametrize("supports_tls", (does_supports_tls, supports_tls_fast))
+def test_does_supports_tls(
+    supports_tls: Callable[[str], bool], input_s: str, expected: str
+) -> None:
+    assert supports_tls(input_s) == expected
 
 
 @pytest.mark.parametrize(
@@ -127,9 +257,46 @@ def test_does_supports_tls(input_s: str, expected: str) -> None:
         ("zazbz[bzb]cdb", True),
     ),
 )
-def test_does_supports_ssl(input_s: str, expected: str) -> None:
-    assert does_support_ssl(input_s) == expected
+@pytest.mark.parametrize("supports_ssl", (does_support_ssl, supports_ssl_fast))
+def test_does_supports_ssl(
+    supports_ssl: Callable[[str], bool], input_s: str, expected: str
+) -> None:
+    assert supports_ssl(input_s) == expected
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_solve_matches_reference(seed: int) -> None:
+    data = "".join(generator.generate(60_000, seed=seed))
+    assert solve(data) == _solve_reference(data)
+
+
+@pytest.mark.parametrize("workers", (1, 2))
+def test_solve_file(tmp_path: Path, workers: int) -> None:
+    data = "".join(generator.generate(90_000, seed=4))
+    path = tmp_path / "ips.txt"
+    path.write_text(data)
+
+    result = solve_file(str(path), workers=workers, chunk_size=1000, serial_threshold=0)
+    assert (result.tls, result.ssl, result.lines) == (*solve(data), data.count("\n"))
+
+
+def test_solve_file_empty(tmp_path: Path) -> None:
+    path = tmp_path / "ips.txt"
+    path.touch()
+    assert solve_file(str(path))[:3] == (0, 0, 0)
 
 
 if __name__ == "__main__":
-    print(f"Solution Parts 1 and 2: {solve(get_input_data(2016, 7))}")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--file")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark()
+        raise SystemExit(0)
+
+    result = solve_file(args.file or get_input_path(2016, 7), workers=args.workers)
+    print(f"Solution Parts 1 and 2: {result.tls, result.ssl}")
+    print(f"> {result.lines:,} lines, {result.lines_per_sec:,.0f} lines/s")
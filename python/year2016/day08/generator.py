@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import random
+from typing import Iterator
+
+from support import generator_main
+
+
+def generate(
+    size: int, seed: int = 0, width: int = 50, height: int = 6
+) -> Iterator[str]:
+    """Yields screen instructions until about `size` bytes were produced
+
+    Rotations may exceed the screen size, so that they wrap around.
+    """
+    rng = random.Random(seed)
+    total = 0
+    while total < size:
+        match rng.randrange(3):
+            case 0:
+                line = f"rect {rng.randint(1, width)}x{rng.randint(1, height)}\n"
+            case 1:
+                line = (
+                    f"rotate column x={rng.randrange(width)} by {rng.randint(0, 20)}\n"
+                )
+            case _:
+                line = f"rotate row y={rng.randrange(height)} by {rng.randint(0, 80)}\n"
+        total += len(line)
+        yield line
+
+
+if __name__ == "__main__":
+    raise SystemExit(generator_main(generate))
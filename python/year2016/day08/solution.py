@@ -1,11 +1,24 @@
+import argparse
+import random
 import sys
 import textwrap
+import time
+from array import array
+from collections.abc import Set
 from enum import Enum
 from io import StringIO
 from typing import IO, Callable
 from typing import Iterable
+from typing import Iterator
+
+import numpy as np
+import numpy.typing as npt
+import pytest
 
 from support import get_input_data
+from support import import_sibling
+
+generator = import_sibling(__file__, "generator")
 
 Ans = int | float | str
 
@@ -65,6 +78,85 @@ class Grid:
         )
 
 
+class BitPixels(Set[tuple[int, int]]):
+    """Read-only set view of the lit pixels of a BitGrid"""
+
+    def __init__(self, bits: npt.NDArray[np.bool_]):
+        self._bits = bits
+
+    def __contains__(self, item: object) -> bool:
+        if not isinstance(item, tuple):
+            return False
+        r, c = item
+        height, width = self._bits.shape
+        return 0 <= r < height and 0 <= c < width and bool(self._bits[r, c])
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        for r, c in np.argwhere(self._bits):
+            yield int(r), int(c)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._bits))
+
+
+class BitGrid(Grid):
+    """Grid backed by a (height, width) NumPy bool array
+
+    A rect is a single slice assignment and rotations roll one row or one
+    column view, so no operation touches more than the pixels it affects.
+
+    For every row the grid also tracks a prefix of columns known to be lit.
+    Rows whose prefix already covers a rect are skipped, so once the top left
+    corner has filled up, a large rect only rewrites the few rows that
+    rotations have disturbed since. Likewise rotating a fully lit row, or a
+    column that is fully lit or dark (per column lit counts), is a no-op.
+    """
+
+    def __init__(self, width: int, height: int):
+        self._width = width
+        self._height = height
+        self._bits = np.zeros((height, width), dtype=np.bool_)
+        self._lit = np.zeros(height, dtype=np.int64)
+        self._col_lit = np.zeros(width, dtype=np.int64)
+
+    @property
+    def pixels(self) -> BitPixels:
+        return BitPixels(self._bits)
+
+    def rect(self, width: int, height: int) -> None:
+        width, height = min(width, self.width), min(height, self.height)
+        rows = np.flatnonzero(self._lit[:height] < width)
+        if not rows.size:
+            return
+
+        start = int(self._lit[rows].min())
+        if rows.size == height:
+            region = self._bits[:height, start:width]
+            self._col_lit[start:width] += height - np.count_nonzero(region, axis=0)
+            region[...] = True
+        else:
+            region = self._bits[rows, start:width]
+            self._col_lit[start:width] += rows.size - np.count_nonzero(region, axis=0)
+            self._bits[rows, start:width] = True
+        self._lit[rows] = width
+
+    def rotate_row(self, row: int, count: int) -> None:
+        # A fully lit row looks the same however it is rotated
+        if count % self.width and self._lit[row] < self.width:
+            bits = np.roll(self._bits[row], count)
+            self._col_lit -= self._bits[row]
+            self._col_lit += bits
+            self._bits[row] = bits
+            first_unlit = int(np.argmin(bits))
+            self._lit[row] = self.width if bits[first_unlit] else first_unlit
+
+    def rotate_col(self, col: int, count: int) -> None:
+        if count % self.height and 0 < self._col_lit[col] < self.height:
+            bits = np.roll(self._bits[:, col], count)
+            self._bits[:, col] = bits
+            self._lit[~bits & (self._lit > col)] = col
+
+
 def print_grid(grid: Grid, on: str = "#", off: str = " ", out: IO = sys.stdout):
     for r in range(grid.height):
         buffer = []
@@ -127,16 +219,113 @@ INSTRUCTION_MAP: dict[OperationType, Callable[[Grid, int, int], None]] = {
 }
 
 
-def solve(s: str, width: int = 50, height: int = 6) -> tuple[Ans, Ans]:
-    grid = Grid(width=width, height=height)
-    for op, a, b in parse_input(s):
-        INSTRUCTION_MAP[op](grid, a, b)
+# Op codes index into the handler tuple built by `execute`
+OP_CODES: dict[OperationType, int] = {
+    OperationType.RECT: 0,
+    OperationType.ROTATE_COLUMN: 1,
+    OperationType.ROTATE_ROW: 2,
+}
+
+
+def compile_instructions(
+    instructions: Iterable[Instruction], width: int, height: int
+) -> "array[int]":
+    """Fuses instructions into a flat array of (op code, a, b) triples
+
+    Rotations of distinct rows (or columns) commute, so within a run of row (or
+    column) rotations the shifts are summed per row (or column) modulo the width
+    (or height), and rotations that end up as no-ops are dropped. Likewise a run
+    of rects only keeps the rects not contained in another one.
+    """
+    program = array("q")
+    pending: dict[int, int] = {}
+    rects: list[tuple[int, int]] = []
+    pending_op = OperationType.RECT
+
+    def flush() -> None:
+        for target, shift in pending.items():
+            if shift:
+                program.extend((OP_CODES[pending_op], target, shift))
+        pending.clear()
+
+        # Widest first: a rect survives only if it is taller than all wider ones
+        tallest = 0
+        for w, h in sorted(rects, reverse=True):
+            if h > tallest:
+                program.extend((OP_CODES[OperationType.RECT], w, h))
+                tallest = h
+        rects.clear()
+
+    for op, a, b in instructions:
+        if op != pending_op:
+            flush()
+            pending_op = op
+
+        match op:
+            case OperationType.RECT:
+                if a and b:
+                    rects.append((a, b))
+            case OperationType.ROTATE_COLUMN:
+                pending[a] = (pending.get(a, 0) + b) % height
+            case OperationType.ROTATE_ROW:
+                pending[a] = (pending.get(a, 0) + b) % width
+
+    flush()
+    return program
+
+
+def execute(grid: Grid, program: "array[int]") -> None:
+    handlers = (grid.rect, grid.rotate_col, grid.rotate_row)
+    it = iter(program)
+    for op, a, b in zip(it, it, it):
+        handlers[op](a, b)
+
+
+def solve(
+    s: str, width: int = 50, height: int = 6, grid_type: type[Grid] = Grid
+) -> tuple[Ans, Ans]:
+    grid = grid_type(width=width, height=height)
+    execute(grid, compile_instructions(parse_input(s), width, height))
 
     buffer = StringIO()
     print_grid(grid, on="\u2588", off="\u0020", out=buffer)
     return len(grid.pixels), buffer.getvalue()
 
 
+def benchmark(max_size: int = 10_000_000) -> None:
+    size = 10_000
+    while size <= max_size:
+        data = "".join(generator.generate(size))
+        for grid_type in (Grid, BitGrid):
+            before = time.perf_counter()
+            solve(data, grid_type=grid_type)
+            elapsed = time.perf_counter() - before
+            name = grid_type.__name__
+            print(f"> {len(data):>11,} bytes {name:>7}: {elapsed * 1000:9.1f} ms")
+        size *= 10
+
+
+def benchmark_large(
+    size: int = 25_000_000, width: int = 10_000, height: int = 10_000
+) -> None:
+    data = "".join(generator.generate(size, width=width, height=height))
+    instructions = data.count("\n")
+
+    before = time.perf_counter()
+    program = compile_instructions(parse_input(data), width, height)
+    compile_time = time.perf_counter() - before
+
+    grid = BitGrid(width, height)
+    before = time.perf_counter()
+    execute(grid, program)
+    elapsed = time.perf_counter() - before
+    print(
+        f"> {instructions:,} instructions ({len(program) // 3:,} after fusion)"
+        f" on {width:,}x{height:,}: compile {compile_time:.2f} s,"
+        f" execute {elapsed:.2f} s, {len(grid.pixels):,} lit"
+    )
+
+
 TEST_INPUT = """\
 rect 3x2
 rotate column x=1 by 1
@@ -169,7 +358,61 @@ def test_part1_execute() -> None:
     assert actual == expected_grid
 
 
+@pytest.mark.parametrize("seed", range(5))
+def test_bit_grid_matches_set_grid(seed: int) -> None:
+    rng = random.Random(seed)
+    width, height = rng.randint(1, 70), rng.randint(1, 10)
+    commands = "".join(generator.generate(4_000, seed, width, height))
+
+    expected, actual = Grid(width, height), BitGrid(width, height)
+    for op, a, b in parse_input(commands):
+        INSTRUCTION_MAP[op](expected, a, b)
+        INSTRUCTION_MAP[op](actual, a, b)
+
+    assert actual == expected
+    assert len(actual.pixels) == len(expected.pixels)
+    assert solve(TEST_INPUT, 7, 3, grid_type=BitGrid) == solve(TEST_INPUT, 7, 3)
+
+
+def test_compile_instructions() -> None:
+    commands = """\
+rotate row y=0 by 4
+rotate row y=1 by 2
+rotate row y=0 by 3
+rect 2x1
+rotate column x=1 by 3
+rect 0x5
+"""
+    program = compile_instructions(parse_input(commands), width=7, height=3)
+    assert list(program) == [2, 1, 2, 0, 2, 1]
+
+
+@pytest.mark.parametrize("grid_type", (Grid, BitGrid))
+@pytest.mark.parametrize("seed", range(5))
+def test_compiled_matches_interpreted(seed: int, grid_type: type[Grid]) -> None:
+    rng = random.Random(seed)
+    width, height = rng.randint(1, 70), rng.randint(1, 40)
+    commands = "".join(generator.generate(6_000, seed, width, height))
+
+    expected, actual = Grid(width, height), grid_type(width, height)
+    for op, a, b in parse_input(commands):
+        INSTRUCTION_MAP[op](expected, a, b)
+    execute(actual, compile_instructions(parse_input(commands), width, height))
+
+    assert actual == expected
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--max-size", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.max_size)
+        benchmark_large()
+        raise SystemExit(0)
+
     part_1, part_2 = solve(get_input_data(2016, 8))
     print(f"Solution part1: {part_1}")
     print(f"Solution part2:\n{part_2}")
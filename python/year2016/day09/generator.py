@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import random
+import string
+from typing import Iterator
+
+from support import generator_main
+
+
+def generate(
+    size: int, seed: int = 0, depth: int = 4, block_size: int = 10_000
+) -> Iterator[str]:
+    """Yields about `size` characters of well formed markers, nested `depth` deep
+
+    A random block of up to `block_size` characters is repeated, so arbitrarily
+    large inputs cost no more to generate than to write. The output is a single
+    line without a trailing newline.
+    """
+    rng = random.Random(seed)
+
+    def block(n: int, level: int) -> str:
+        parts: list[str] = []
+        total = 0
+        while total < n:
+            if level and rng.random() < 0.4:
+                body = block(rng.randint(1, min(n - total, 64)), level - 1)
+                parts.append(f"({len(body)}x{rng.randint(1, 9)}){body}")
+            else:
+                parts.append("".join(rng.choices(string.ascii_uppercase, k=8)))
+            total += len(parts[-1])
+        return "".join(parts)
+
+    template = block(min(size, block_size), depth)
+    for _ in range(max(size // len(template), 1)):
+        yield template
+
+
+if __name__ == "__main__":
+    raise SystemExit(generator_main(generate))
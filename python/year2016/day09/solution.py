@@ -1,77 +1,287 @@
+import argparse
+import re
+import time
+from bisect import bisect_right
+from io import StringIO
 from typing import cast
+from typing import IO
+from typing import Iterable
+from typing import Iterator
 
+import numpy as np
 import pytest
 
 from support import get_input_data
+from support import import_sibling
+
+generator = import_sibling(__file__, "generator")
 
 Ans = int | str
 Solution = tuple[Ans, Ans]
 
 
-def decompress_v1(s: str) -> int:
-    it = iter(s)
-    num_1 = ""
-    num_2 = ""
+MARKER = re.compile(r"\((\d+)x(\d+)\)")
+
+
+def decompressed_length(
+    data: str | IO[str], recursive: bool = True, chunk_size: int = 1 << 20
+) -> int:
+    """Computes the decompressed length in a single pass without recursion
+
+    `data` may be a string or a text file-like object, which is consumed in
+    chunks of `chunk_size` characters. Whitespace is ignored. Open markers are
+    kept on an explicit stack of (span end, weight), so memory is bounded by the
+    nesting depth rather than by the input size.
+    """
+    chunks: Iterable[str]
+    if isinstance(data, str):
+        chunks = (data,)
+    else:
+        chunks = iter(lambda: data.read(chunk_size), "")
+
     length = 0
+    offset = 0  # absolute position of buffer[0]
+    stack: list[tuple[int, int]] = []
+    buffer = ""
 
-    try:
-        while True:
-            c = next(it)
-            if c == "(":
-                while (c := next(it)) != "x":
-                    num_1 += c
-
-                while (c := next(it)) != ")":
-                    num_2 += c
-
-                c_count, rep = int(num_1), int(num_2)
-                for _ in range(c_count):
-                    next(it)
-                length += c_count * rep
-                num_1, num_2 = "", ""
+    for chunk in chunks:
+        buffer += "".join(chunk.split())
+        idx = 0
+        size = len(buffer)
+
+        while idx < size:
+            if stack:
+                span_end, weight = stack[-1]
+                span_end -= offset
             else:
-                length += 1
-    except StopIteration:
-        pass
+                span_end, weight = size, 1
+
+            # v1 only expands markers found outside any span
+            if recursive or not stack:
+                marker = buffer.find("(", idx, min(span_end, size))
+            else:
+                marker = -1
+
+            stop = min(span_end, size) if marker == -1 else marker
+            length += (stop - idx) * weight
+            idx = stop
+
+            if stack and idx == span_end:
+                stack.pop()
+            elif idx == marker:
+                match = MARKER.match(buffer, idx)
+                if match is None:
+                    if buffer.find(")", idx) == -1:
+                        break  # marker split across chunks
+                    raise ValueError(f"Invalid marker at: {offset + idx}")
+                if stack and match.end() > span_end:
+                    raise ValueError(f"Marker overruns its span at: {offset + idx}")
+
+                idx = match.end()
+                end = offset + idx + int(match[1])
+                if stack:
+                    end = min(end, stack[-1][0])
+                stack.append((end, weight * int(match[2])))
+
+        buffer = buffer[idx:]
+        offset += idx
+
+    if buffer:
+        raise ValueError(f"Truncated marker at: {offset}")
 
     return length
 
 
+def decompress_v1(s: str) -> int:
+    return decompressed_length(s, recursive=False)
+
+
 def decompress_v2(s: str) -> int:
-    def decompress_rec(start: int, end: int) -> int:
-        idx = start
-        length = 0
-        num_1 = ""
-        num_2 = ""
-
-        while idx < end:
-            c = s[idx]
-            if c == "(":
-                idx += 1
-                while (c := s[idx]) != "x":
-                    num_1 += c
-                    idx += 1
-
-                idx += 1
-
-                while (c := s[idx]) != ")":
-                    num_2 += c
-                    idx += 1
-
-                idx += 1
-
-                c_count, rep = int(num_1), int(num_2)
-                length += decompress_rec(idx, idx + c_count) * rep
-                idx = idx + c_count
-                num_1 = ""
-                num_2 = ""
+    return decompressed_length(s, recursive=True)
+
+
+def decompress_v2_weighted(s: str) -> int:
+    """Computes the v2 length as a weighted sum over the compressed characters
+
+    Every character is weighted by the product of the repeat counts of all the
+    markers covering it, and marker characters themselves are masked out. Note
+    that weights are int64, so lengths beyond 2**63 overflow.
+    """
+    s = "".join(s.split())
+    weights = np.ones(len(s), dtype=np.int64)
+    is_data = np.ones(len(s), dtype=np.bool_)
+
+    for match in MARKER.finditer(s):
+        start, end = match.span()
+        is_data[start:end] = False
+        weights[end : end + int(match[1])] *= int(match[2])
+
+    return int(weights.sum(where=is_data))
+
+
+class _Sequence:
+    def __init__(self) -> None:
+        self.parts: list[str | _Repeat] = []
+        self.offsets: list[int] = []
+        self.length = 0
+
+    def append(self, part: "str | _Repeat") -> None:
+        self.parts.append(part)
+
+    def close(self) -> None:
+        # Parts are only measurable once nested sequences have been closed
+        for part in self.parts:
+            self.offsets.append(self.length)
+            self.length += len(part) if isinstance(part, str) else part.length
+
+
+class _Repeat:
+    def __init__(self, body: _Sequence, times: int):
+        self.body = body
+        self.times = times
+
+    @property
+    def length(self) -> int:
+        return self.body.length * self.times
+
+
+class Decompressed:
+    """Virtual decompressed output, indexable without materializing it
+
+    The input is parsed into a tree of literal runs and repeats, with prefix
+    offsets per level, so looking up a character costs one bisect per level of
+    nesting (O(depth * log n)) however large the expansion is. Use `length`
+    rather than `len()` for expansions larger than sys.maxsize.
+    """
+
+    def __init__(self, s: str, recursive: bool = True):
+        self._root = self._parse("".join(s.split()), recursive)
+
+    @staticmethod
+    def _parse(s: str, recursive: bool) -> _Sequence:
+        root = _Sequence()
+        stack: list[tuple[_Sequence, int]] = [(root, len(s))]
+        idx = 0
+
+        while stack:
+            seq, end = stack[-1]
+            if idx >= end:
+                seq.close()
+                stack.pop()
+                continue
+
+            marker = s.find("(", idx, end)
+            if marker == -1:
+                marker = end
+            if marker > idx:
+                seq.append(s[idx:marker])
+                idx = marker
+                continue
+
+            match = MARKER.match(s, idx)
+            if match is None:
+                raise ValueError(f"Invalid marker at: {idx}")
+            if match.end() > end:
+                raise ValueError(f"Marker overruns its span at: {idx}")
+
+            idx = match.end()
+            span_end = min(idx + int(match[1]), end)
+            body = _Sequence()
+            seq.append(_Repeat(body, int(match[2])))
+            if recursive:
+                stack.append((body, span_end))
             else:
-                length += 1
-                idx += 1
+                body.append(s[idx:span_end])
+                body.close()
+                idx = span_end
 
-        return length
+        return root
 
-    return decompress_rec(0, len(s))
+    @property
+    def length(self) -> int:
+        return self._root.length
+
+    def __len__(self) -> int:
+        return self._root.length
+
+    def char_at(self, offset: int) -> str:
+        if offset < 0:
+            offset += self.length
+        if not 0 <= offset < self.length:
+            raise IndexError(f"Offset out of range: {offset}")
+
+        seq = self._root
+        while True:
+            i = bisect_right(seq.offsets, offset) - 1
+            part = seq.parts[i]
+            offset -= seq.offsets[i]
+            if isinstance(part, str):
+                return part[offset]
+            seq = part.body
+            offset %= seq.length
+
+    def __getitem__(self, key: int | slice) -> str:
+        if isinstance(key, int):
+            return self.char_at(key)
+
+        start, stop, step = key.indices(self.length)
+        if step != 1:
+            raise ValueError("Only contiguous slices are supported")
+        return "".join(self._pieces(start, stop))
+
+    @staticmethod
+    def _walk(
+        seq: _Sequence, lo: int, hi: int
+    ) -> Iterator[str | tuple[_Sequence, int, int]]:
+        # Yields literal pieces, or sub-ranges of nested sequences to descend into
+        i = max(bisect_right(seq.offsets, lo) - 1, 0)
+        while i < len(seq.parts) and seq.offsets[i] < hi:
+            part, base = seq.parts[i], seq.offsets[i]
+            a, b = max(lo - base, 0), hi - base
+            if isinstance(part, str):
+                yield part[a:b]
+            elif part.length:
+                body = part.body
+                b = min(b, part.length)
+                k = a // body.length
+                while k * body.length < b:
+                    start = k * body.length
+                    yield body, max(a - start, 0), min(b - start, body.length)
+                    k += 1
+            i += 1
+
+    def _pieces(self, lo: int, hi: int) -> Iterator[str]:
+        stack = [self._walk(self._root, lo, hi)]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+            elif isinstance(item, str):
+                yield item
+            else:
+                stack.append(self._walk(*item))
+
+    def iter_chunks(
+        self, chunk_size: int = 1 << 16, start: int = 0, stop: int | None = None
+    ) -> Iterator[str]:
+        """Lazily yields the output between start and stop in chunk_size pieces"""
+        stop = self.length if stop is None else min(stop, self.length)
+        buffer: list[str] = []
+        buffered = 0
+        for piece in self._pieces(start, stop):
+            pos = 0
+            while pos < len(piece):
+                take = piece[pos : pos + chunk_size - buffered]
+                pos += len(take)
+                buffer.append(take)
+                buffered += len(take)
+                if buffered == chunk_size:
+                    yield "".join(buffer)
+                    buffer.clear()
+                    buffered = 0
+
+        if buffer:
+            yield "".join(buffer)
 
 
 def solve(s: str) -> tuple[Ans, Ans]:
@@ -81,6 +291,21 @@ def solve(s: str) -> tuple[Ans, Ans]:
     return cast(Solution, tuple(list(sum(f(line) for line in lines) for f in fs)))
 
 
+def benchmark(max_size: int = 100_000_000) -> None:
+    size = 10_000
+    while size <= max_size:
+        data = "".join(generator.generate(size))
+        for name, f in (
+            ("stack", decompress_v2),
+            ("weighted", decompress_v2_weighted),
+        ):
+            before = time.perf_counter()
+            f(data)
+            elapsed = time.perf_counter() - before
+            print(f"> {len(data):>11,} chars {name:>8}: {elapsed * 1000:10.1f} ms")
+        size *= 10
+
+
 TEST_INPUT = """\
 ADVENT
 A(1x5)BC
@@ -121,9 +346,125 @@ def test_solve(input_s: str, expected: Solution) -> None:
 )
 def test_decompress(input_s: str, expected: int) -> None:
     assert decompress_v2(input_s) == expected
+    assert decompress_v2_weighted(input_s) == expected
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_decompress_v2_weighted_generated(seed: int) -> None:
+    data = "".join(generator.generate(5_000, seed=seed))
+    assert decompress_v2_weighted(data) == decompress_v2(data)
+
+
+@pytest.mark.parametrize("recursive", (False, True))
+@pytest.mark.parametrize("chunk_size", (1, 2, 3, 7, 1024))
+def test_decompressed_length_stream(recursive: bool, chunk_size: int) -> None:
+    expected = decompressed_length(TEST_INPUT_2, recursive=recursive)
+    actual = decompressed_length(
+        StringIO(TEST_INPUT_2), recursive=recursive, chunk_size=chunk_size
+    )
+    assert actual == expected
+
+
+def test_decompressed_length_deep_nesting() -> None:
+    s = "A"
+    for _ in range(10_000):
+        s = f"({len(s)}x2){s}"
+
+    assert decompress_v2(s) == 2**10_000
+    outer = MARKER.match(s)
+    assert outer
+    assert decompress_v1(s) == len(s[outer.end() :]) * 2
+
+
+@pytest.mark.parametrize(
+    "s", ("(3x3", "(3x3)AB(", "(3y3)ABC", "(4x2)(1x3)A", "(3x2)(5x3)ABCDEFG")
+)
+def test_decompressed_length_malformed(s: str) -> None:
+    with pytest.raises(ValueError):
+        decompress_v2(s)
+
+
+def _expand(s: str, recursive: bool) -> str:
+    # Naive reference expansion, only usable on tiny inputs
+    out: list[str] = []
+    idx = 0
+    while idx < len(s):
+        match = MARKER.match(s, idx)
+        if match is None:
+            out.append(s[idx])
+            idx += 1
+            continue
+        body = s[match.end() : match.end() + int(match[1])]
+        if recursive:
+            body = _expand(body, recursive)
+        out.append(body * int(match[2]))
+        idx = match.end() + int(match[1])
+    return "".join(out)
+
+
+@pytest.mark.parametrize("recursive", (False, True))
+@pytest.mark.parametrize(
+    "input_s",
+    (
+        "ADVENT",
+        "A(1x5)BC",
+        "X(8x2)(3x3)ABCY",
+        "(6x1)(1x3)A",
+        "A(0x4)B",
+        "(25x3)(3x3)ABC(2x3)XY(5x2)PQRSTX(18x9)(3x2)TWO(5x7)SEVEN",
+    ),
+)
+def test_decompressed_random_access(input_s: str, recursive: bool) -> None:
+    expected = _expand(input_s, recursive)
+    actual = Decompressed(input_s, recursive=recursive)
+
+    assert len(actual) == len(expected)
+    assert "".join(actual[i] for i in range(len(actual))) == expected
+    assert actual[-1] == expected[-1]
+    for start, stop in ((0, len(expected)), (1, 7), (5, 100), (3, 3)):
+        assert actual[start:stop] == expected[start:stop]
+    assert list(actual.iter_chunks(4)) == [
+        expected[i : i + 4] for i in range(0, len(expected), 4)
+    ]
+
+
+def test_decompressed_huge_expansion() -> None:
+    s = "XY"
+    for _ in range(50):
+        s = f"({len(s)}x1000)" + s
+
+    actual = Decompressed(s)
+    assert actual.length == 2 * 1000**50 == decompress_v2(s)
+    assert actual.char_at(actual.length - 1) == "Y"
+    assert actual[10**140 : 10**140 + 5] == "XYXYX"
+    assert next(actual.iter_chunks(6)) == "XYXYXY"
+
+
+@pytest.mark.parametrize("chunk_size", (1, 3, 7))
+def test_decompressed_iter_chunks_long_literal(chunk_size: int) -> None:
+    s = "ABCDEFGHIJ" * 50 + "(3x2)XYZ"
+    expected = _expand(s, recursive=True)
+    chunks = list(Decompressed(s).iter_chunks(chunk_size, start=2, stop=505))
+    assert "".join(chunks) == expected[2:505]
+    assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+
+
+@pytest.mark.parametrize("s", ("(3x3", "(4x2)(1x3)A", "(3x2)(5x3)ABCDEFG"))
+def test_decompressed_malformed(s: str) -> None:
+    with pytest.raises(ValueError):
+        Decompressed(s)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--max-size", type=int, default=100_000_000)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.max_size)
+        raise SystemExit(0)
+
     part_1, part_2 = solve(get_input_data(2016, 9))
     print(f"Solution part1: {part_1}")
     print(f"Solution part2:{part_2}")
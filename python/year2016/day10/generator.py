@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import random
+from collections import deque
+from itertools import islice
+from typing import Iterator
+
+from support import generator_main
+
+# Bots only hand chips to one of the next LOOKAHEAD bots
+LOOKAHEAD = 64
+
+
+def _distinct_numbers(
+    rng: random.Random, block_size: int, exclude: tuple[int, ...]
+) -> Iterator[int]:
+    # Shuffled blocks of consecutive ranges: never repeats, bounded memory
+    base = 1
+    while True:
+        for number in rng.sample(range(base, base + block_size), block_size):
+            if number not in exclude:
+                yield number
+        base += block_size
+
+
+def generate(
+    size: int,
+    seed: int = 0,
+    comparison: tuple[int, int] = (61, 17),
+    fan_out: float = 0.8,
+    block_size: int = 1 << 16,
+) -> Iterator[str]:
+    """Yields a bot factory of about `size` bytes
+
+    Bots only pass chips on to one of the next few bots defined after them, so
+    the factory never stalls, and every bot ends up with exactly two chips. One
+    bot compares the chips in `comparison`, and outputs 0, 1 and 2 always
+    receive a chip. `fan_out` is the chance that a chip goes to another bot
+    rather than an output; larger values give longer hand-over chains.
+
+    Lines are shuffled within blocks of `block_size`, so memory stays bounded
+    however large `size` is.
+    """
+    rng = random.Random(seed)
+    # A bot takes about 65 bytes: its instruction plus the odd input bin
+    n = max(size // 65, 3)
+    special = rng.randrange(n)
+    ids = _distinct_numbers(rng, block_size * 4, ())
+    chips = _distinct_numbers(rng, block_size * 4, comparison)
+    upcoming = deque(islice(ids, LOOKAHEAD + 1))
+    missing: dict[int, int] = {}
+    lines: list[str] = []
+    outputs = 0
+
+    for i in range(n):
+        bot = upcoming.popleft()
+        upcoming.append(next(ids))
+
+        # Every bot that could hand this one a chip has been defined by now
+        if i == special:
+            lines.extend(f"value {chip} goes to bot {bot}" for chip in comparison)
+        else:
+            count = missing.pop(bot, 2)
+            lines.extend(f"value {next(chips)} goes to bot {bot}" for _ in range(count))
+
+        # The last two bots never receive from other bots, so both their chips
+        # go to outputs
+        reachable = min(LOOKAHEAD, n - 2 - (i + 1))
+        candidates = [
+            b
+            for j, b in enumerate(islice(upcoming, max(reachable, 0)), i + 1)
+            if j != special and missing.get(b, 2)
+        ]
+        targets = []
+        for _ in range(2):
+            if candidates and rng.random() < fan_out:
+                target = rng.choice(candidates)
+                missing[target] = missing.get(target, 2) - 1
+                if not missing[target]:
+                    candidates.remove(target)
+                targets.append(f"bot {target}")
+            else:
+                targets.append(f"output {outputs}")
+                outputs += 1
+        lines.append(f"bot {bot} gives low to {targets[0]} and high to {targets[1]}")
+
+        if len(lines) >= block_size:
+            rng.shuffle(lines)
+            yield from (f"{line}\n" for line in lines)
+            lines.clear()
+
+    rng.shuffle(lines)
+    yield from (f"{line}\n" for line in lines)
+
+
+if __name__ == "__main__":
+    raise SystemExit(generator_main(generate))
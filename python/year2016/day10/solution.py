@@ -1,16 +1,21 @@
+import argparse
+import time
+from array import array
 from collections import deque
 from enum import auto
 from enum import Enum
 from functools import reduce
-from typing import Any
+from typing import Callable
 from typing import Iterable
 from typing import NamedTuple
 from typing import Protocol
 
 import pytest
-from mypy_extensions import Arg
 
 from support import get_input_data
+from support import import_sibling
+
+generator = import_sibling(__file__, "generator")
 
 Ans = int | str
 Solution = tuple[Ans, Ans]
@@ -19,27 +24,6 @@ Chip = int
 Id = int
 
 
-class SupportsLessThan(Protocol):
-    def __lt__(self, __other: Any) -> bool:
-        ...
-
-
-def nonemin(*args: Arg(SupportsLessThan | None)) -> SupportsLessThan:
-    filtered = [arg for arg in args if arg is not None]
-    if not filtered:
-        raise ValueError("All values cannot be None")
-
-    return min(filtered)
-
-
-def nonemax(*args: Arg(SupportsLessThan | None)) -> SupportsLessThan:
-    filtered = [arg for arg in args if arg is not None]
-    if not filtered:
-        raise ValueError("All values cannot be None")
-
-    return max(filtered)
-
-
 class ControlRoomError(Exception):
     pass
 
@@ -111,57 +95,137 @@ class Action(NamedTuple):
     args: tuple[int | None, int | None] | tuple[...]
 
 
+NO_CHIP = -1
+NO_TARGET = -(1 << 62)
+
+
+class ComparisonIndex:
+    """Every comparison made during a simulation, queryable in both directions"""
+
+    def __init__(self) -> None:
+        self._by_pair: dict[tuple[Chip, Chip], Id] = {}
+        self._by_bot: dict[Id, list[tuple[Chip, Chip]]] = {}
+
+    def record(self, bot_id: Id, low: Chip, high: Chip) -> None:
+        self._by_pair[(low, high)] = bot_id
+        if bot_id in self._by_bot:
+            self._by_bot[bot_id].append((low, high))
+        else:
+            self._by_bot[bot_id] = [(low, high)]
+
+    def bot_comparing(self, a: Chip, b: Chip) -> Id | None:
+        """Returns the bot that compared chips a and b, in any order"""
+        return self._by_pair.get((a, b) if a < b else (b, a))
+
+    def comparisons_of(self, bot_id: Id) -> list[tuple[Chip, Chip]]:
+        """Returns the (low, high) pairs compared by a bot, in order"""
+        return list(self._by_bot.get(bot_id, ()))
+
+    def action_for(self, pair: tuple[Chip, Chip] | None) -> Action | None:
+        if pair is None or (bot_id := self.bot_comparing(*pair)) is None:
+            return None
+        return Action(bot_id, ActionType.Compare, (min(pair), max(pair)))
+
+    def __len__(self) -> int:
+        return len(self._by_pair)
+
+
+def _normalized_pair(pair: tuple[Chip, Chip] | None) -> tuple[Chip, Chip]:
+    # NO_CHIP never takes part in a comparison, so "no pair" never matches
+    return (min(pair), max(pair)) if pair is not None else (NO_CHIP, NO_CHIP)
+
+
+def _not_recorded() -> ControlRoomError:
+    return ControlRoomError("Comparisons are only kept with record_comparisons=True")
+
+
 class ControlRoom:
-    def __init__(self, comparison_of_interest: tuple[Chip, Chip]):
+    """Routes chips between bots and outputs
+
+    A bot fires as soon as it holds two chips and a pending command. Its low
+    chip, and everything that sets off, is delivered before its high chip, but
+    through a stack of pending deliveries, so arbitrarily long hand-off chains
+    never recurse.
+    Only the comparison of interest is tracked unless `record_comparisons` is
+    set, in which case every comparison goes into a ComparisonIndex.
+    """
+
+    def __init__(
+        self,
+        comparison_of_interest: tuple[Chip, Chip] | None = None,
+        record_comparisons: bool = False,
+    ):
         self._bots: dict[Id, Bot] = {}
         self._outputs: dict[Id, Output] = {}
-        self._comparison_of_interest = comparison_of_interest
-        self._action_of_interest: Action | None = None
+        self._interest = _normalized_pair(comparison_of_interest)
+        self._interest_sender: Id | None = None
+        self._comparisons = ComparisonIndex() if record_comparisons else None
+        self._pending: list[tuple[RecipientType, Id, Chip]] = []
 
     def process(self, instructions: Iterable[TInstruction]) -> None:
         for instruction in instructions:
-            match instruction.instruction_type:
-                case InstructionType.Assign:
+            match instruction:
+                case AssignInstruction():
                     self.assign_internal(instruction)
-                case InstructionType.Give:
-                    bot_id = instruction.giver_id
-                    if bot_id not in self._bots:
-                        self._bots[bot_id] = Bot(id_=bot_id, ctrl_room=self)
-                    self._bots[bot_id].add_command(instruction)
+                case GiveInstruction():
+                    bot = self._get_bot(instruction.giver_id)
+                    bot.add_command(instruction)
+                    if bot.is_ready:
+                        self._fire(bot)
                 case _:
                     raise ValueError(f"Unexpected instruction: {instruction}")
-
-    def notify(self, action: Action) -> None:
-        if action.action_type == ActionType.Compare:
-            a, b = self._comparison_of_interest
-            if action.args == (a, b) or action.args == (b, a):
-                self._action_of_interest = action
+            self._run()
 
     def assign_internal(self, instruction: AssignInstruction) -> None:
-        r_id = instruction.recipient_id
-        r_type = instruction.recipient_type
-        chip = instruction.chip
+        self._deliver(
+            instruction.recipient_type, instruction.recipient_id, instruction.chip
+        )
+
+    def _get_bot(self, bot_id: Id) -> "Bot":
+        if bot_id not in self._bots:
+            self._bots[bot_id] = Bot(id_=bot_id)
+        return self._bots[bot_id]
 
-        t: Recipient
-        d: dict[Id, Recipient]
+    def _deliver(self, r_type: RecipientType, r_id: Id, chip: Chip) -> None:
         if r_type == RecipientType.Bot:
-            t = Bot
-            args = dict(id_=r_id, ctrl_room=self)
-            d = self._bots
+            bot = self._get_bot(r_id)
+            bot.accept(chip)
+            if bot.is_ready:
+                self._fire(bot)
         elif r_type == RecipientType.Output:
-            t = Output
-            args = dict(id_=r_id)
-            d = self._outputs
+            if r_id not in self._outputs:
+                self._outputs[r_id] = Output(id_=r_id)
+            self._outputs[r_id].accept(chip)
         else:
             raise ValueError(f"Cannot recognize type: {r_type}")
 
-        if r_id not in d:
-            d[r_id] = t(**args)
-        d[r_id].accept(chip)
+    def _fire(self, bot: "Bot") -> None:
+        command = bot.pop_command()
+        low, high = bot.take_chips()
+        if (low, high) == self._interest:
+            self._interest_sender = bot.id
+        if self._comparisons is not None:
+            self._comparisons.record(bot.id, low, high)
+        # Pushed in reverse, so the low chip is handed over first
+        to_low, to_high = command.low, command.high
+        self._pending.append((to_high.recipient_type, to_high.recipient_id, high))
+        self._pending.append((to_low.recipient_type, to_low.recipient_id, low))
+
+    def _run(self) -> None:
+        while self._pending:
+            self._deliver(*self._pending.pop())
 
     @property
     def action_of_interest(self) -> Action | None:
-        return self._action_of_interest
+        if self._interest_sender is None:
+            return None
+        return Action(self._interest_sender, ActionType.Compare, self._interest)
+
+    @property
+    def comparisons(self) -> ComparisonIndex:
+        if self._comparisons is None:
+            raise _not_recorded()
+        return self._comparisons
 
     @property
     def outputs(self) -> dict[Id, "Output"]:
@@ -169,56 +233,42 @@ class ControlRoom:
 
 
 class Bot(Recipient, HasId):
-    def __init__(self, id_: Id, ctrl_room: ControlRoom):
+    def __init__(self, id_: Id):
         self._id = id_
         self._low_chip: Chip | None = None
         self._high_chip: Chip | None = None
-        self._queue = deque()
-        self._ctrl_room = ctrl_room
+        self._queue: deque[GiveInstruction] = deque()
 
     def accept(self, chip: Chip) -> None:
-        if self._low_chip is not None and self._high_chip is not None:
+        if self._high_chip is not None:
             raise ControlRoomError("Bot cannot accept more chips")
 
-        if self._low_chip is None and self._high_chip is None:
+        if self._low_chip is None:
             self._low_chip = chip
+        elif chip < self._low_chip:
+            self._low_chip, self._high_chip = chip, self._low_chip
         else:
-            min_ = nonemin(self._low_chip, self._high_chip, chip)
-            max_ = nonemax(self._low_chip, self._high_chip, chip)
-            self._low_chip = min_
-            self._high_chip = max_
-            if self._queue:
-                self._execute_command()
+            self._high_chip = chip
 
     def add_command(self, command: GiveInstruction) -> None:
-        self._queue.appendleft(command)
-        if self._low_chip and self._high_chip:
-            self._execute_command()
+        self._queue.append(command)
+
+    @property
+    def is_ready(self) -> bool:
+        return self._high_chip is not None and bool(self._queue)
 
-    def _execute_command(self) -> None:
+    def pop_command(self) -> GiveInstruction:
         if not self._queue:
             raise ControlRoomError(f"No commands to execute for: {self}")
-        command: GiveInstruction = self._queue.pop()
-        action = Action(
-            action_type=ActionType.Compare,
-            sender=self.id,
-            args=(self._low_chip, self._high_chip),
-        )
-        self._ctrl_room.notify(action)
-        low = AssignInstruction(
-            recipient_type=command.low.recipient_type,
-            recipient_id=command.low.recipient_id,
-            chip=self._low_chip,
-        )
-        high = AssignInstruction(
-            recipient_type=command.high.recipient_type,
-            recipient_id=command.high.recipient_id,
-            chip=self._high_chip,
-        )
+        return self._queue.popleft()
+
+    def take_chips(self) -> tuple[Chip, Chip]:
+        if self._low_chip is None or self._high_chip is None:
+            raise ControlRoomError(f"Bot does not hold two chips: {self}")
+        chips = self._low_chip, self._high_chip
         self._low_chip = None
         self._high_chip = None
-        self._ctrl_room.assign_internal(low)
-        self._ctrl_room.assign_internal(high)
+        return chips
 
     def __str__(self) -> str:
         empty = "Empty"
@@ -251,6 +301,138 @@ class Output(Recipient, HasId):
         return self._chips
 
 
+class ArrayControlRoom:
+    """ControlRoom keeping all bot state in flat arrays indexed by bot id
+
+    Chips use NO_CHIP instead of None, and give targets are encoded as the bot
+    id, or as ~id for outputs, with NO_TARGET for bots without a command. Each
+    bot can hold a single pending command, which is all puzzle inputs need.
+    Like ControlRoom, only the comparison of interest is tracked by default, so
+    hand-offs allocate nothing.
+    """
+
+    def __init__(
+        self,
+        comparison_of_interest: tuple[Chip, Chip] | None = None,
+        record_comparisons: bool = False,
+    ):
+        self._low = array("q")
+        self._high = array("q")
+        self._low_to = array("q")
+        self._high_to = array("q")
+        self._outputs: dict[Id, Output] = {}
+        self._interest = _normalized_pair(comparison_of_interest)
+        self._interest_sender: Id | None = None
+        self._comparisons = ComparisonIndex() if record_comparisons else None
+        self._ready: deque[Id] = deque()
+
+    def _reserve(self, bot_id: Id) -> None:
+        size = len(self._low)
+        if bot_id >= size:
+            extra = max(bot_id + 1, size * 2) - size
+            self._low.extend(array("q", [NO_CHIP]) * extra)
+            self._high.extend(array("q", [NO_CHIP]) * extra)
+            self._low_to.extend(array("q", [NO_TARGET]) * extra)
+            self._high_to.extend(array("q", [NO_TARGET]) * extra)
+
+    @staticmethod
+    def _target(directive: GiveDirective | AssignInstruction) -> int:
+        if directive.recipient_type == RecipientType.Bot:
+            return directive.recipient_id
+        return ~directive.recipient_id
+
+    def process(self, instructions: Iterable[TInstruction]) -> None:
+        for instruction in instructions:
+            match instruction:
+                case AssignInstruction():
+                    self._deliver(self._target(instruction), instruction.chip)
+                case GiveInstruction():
+                    bot_id = instruction.giver_id
+                    self._reserve(bot_id)
+                    if self._low_to[bot_id] != NO_TARGET:
+                        raise ControlRoomError(f"Bot {bot_id} already has a command")
+                    self._low_to[bot_id] = self._target(instruction.low)
+                    self._high_to[bot_id] = self._target(instruction.high)
+                    if self._high[bot_id] != NO_CHIP:
+                        self._ready.append(bot_id)
+                case _:
+                    raise ValueError(f"Unexpected instruction: {instruction}")
+            self._run()
+
+    def _deliver(self, target: int, chip: Chip) -> None:
+        if target < 0:
+            output_id = ~target
+            if output_id not in self._outputs:
+                self._outputs[output_id] = Output(id_=output_id)
+            self._outputs[output_id].accept(chip)
+            return
+
+        self._reserve(target)
+        low = self._low[target]
+        if low == NO_CHIP:
+            self._low[target] = chip
+            return
+        if self._high[target] != NO_CHIP:
+            raise ControlRoomError("Bot cannot accept more chips")
+
+        if chip < low:
+            self._low[target], self._high[target] = chip, low
+        else:
+            self._high[target] = chip
+        if self._low_to[target] != NO_TARGET:
+            self._ready.append(target)
+
+    def _run(self) -> None:
+        record = self._comparisons.record if self._comparisons is not None else None
+        want_low, want_high = self._interest
+        while self._ready:
+            bot_id = self._ready.popleft()
+            low, high = self._low[bot_id], self._high[bot_id]
+            low_to, high_to = self._low_to[bot_id], self._high_to[bot_id]
+            self._low[bot_id] = self._high[bot_id] = NO_CHIP
+            self._low_to[bot_id] = self._high_to[bot_id] = NO_TARGET
+
+            if low == want_low and high == want_high:
+                self._interest_sender = bot_id
+            if record is not None:
+                record(bot_id, low, high)
+            self._deliver(low_to, low)
+            self._deliver(high_to, high)
+
+    @property
+    def action_of_interest(self) -> Action | None:
+        if self._interest_sender is None:
+            return None
+        return Action(self._interest_sender, ActionType.Compare, self._interest)
+
+    @property
+    def comparisons(self) -> ComparisonIndex:
+        if self._comparisons is None:
+            raise _not_recorded()
+        return self._comparisons
+
+    @property
+    def outputs(self) -> dict[Id, Output]:
+        return self._outputs
+
+
+class Room(Protocol):
+    def process(self, instructions: Iterable[TInstruction]) -> None:
+        ...
+
+    @property
+    def action_of_interest(self) -> Action | None:
+        ...
+
+    @property
+    def comparisons(self) -> ComparisonIndex:
+        ...
+
+    @property
+    def outputs(self) -> dict[Id, Output]:
+        ...
+
+
 def parse_input(s: str) -> Iterable[AssignInstruction | GiveInstruction]:
     for command in s.splitlines():
         match command.split():
@@ -286,9 +468,13 @@ def parse_input(s: str) -> Iterable[AssignInstruction | GiveInstruction]:
                 raise ValueError(f"Unexpected command: {command}")
 
 
-def solve(s: str, comparison: tuple[int, int] = (61, 17)) -> Solution:
+def solve(
+    s: str,
+    comparison: tuple[int, int] = (61, 17),
+    room_type: Callable[[tuple[Chip, Chip] | None], Room] = ControlRoom,
+) -> Solution:
     instructions = parse_input(s)
-    control = ControlRoom(comparison_of_interest=comparison)
+    control = room_type(comparison)
     control.process(instructions)
 
     if not control.action_of_interest:
@@ -301,6 +487,19 @@ def solve(s: str, comparison: tuple[int, int] = (61, 17)) -> Solution:
     return control.action_of_interest.sender, m
 
 
+def benchmark(max_size: int = 100_000_000) -> None:
+    size = 10_000
+    while size <= max_size:
+        data = "".join(generator.generate(size))
+        for room_type in (ControlRoom, ArrayControlRoom):
+            before = time.perf_counter()
+            solve(data, room_type=room_type)
+            elapsed = time.perf_counter() - before
+            name = room_type.__name__
+            print(f"> {len(data):>11,} bytes {name:>16}: {elapsed * 1000:9.1f} ms")
+        size *= 10
+
+
 TEST_INPUT = """\
 value 5 goes to bot 2
 bot 2 gives low to bot 1 and high to bot 0
@@ -311,15 +510,125 @@ value 2 goes to bot 2
 """
 
 
+@pytest.mark.parametrize("room_type", (ControlRoom, ArrayControlRoom))
 @pytest.mark.parametrize(
     ("input_s", "expected"),
     ((TEST_INPUT, (2, 30)),),
 )
-def test_solve(input_s: str, expected: Solution) -> None:
-    solve(input_s, (2, 5))
+def test_solve(
+    room_type: Callable[[tuple[Chip, Chip] | None], Room],
+    input_s: str,
+    expected: Solution,
+) -> None:
+    assert solve(input_s, (2, 5), room_type=room_type) == expected
+
+
+def _chain_input(length: int, big_chip: int) -> str:
+    # Bot i compares chip i with big_chip and passes big_chip on to bot i + 1
+    lines = []
+    for i in range(length):
+        high = f"bot {i + 1}" if i + 1 < length else f"output {length}"
+        lines.append(f"bot {i} gives low to output {i} and high to {high}")
+    for i in reversed(range(length)):
+        lines.append(f"value {i} goes to bot {i}")
+    lines.append(f"value {big_chip} goes to bot 0")
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("room_type", (ControlRoom, ArrayControlRoom))
+def test_long_chain_does_not_recurse(
+    room_type: Callable[[tuple[Chip, Chip] | None], Room]
+) -> None:
+    length, big_chip = 20_000, 10**9
+    control = room_type((big_chip, 12_345))
+    control.process(parse_input(_chain_input(length, big_chip)))
+
+    assert control.action_of_interest
+    assert control.action_of_interest.sender == 12_345
+    assert control.outputs[length].chips == {big_chip}
+    assert all(control.outputs[i].chips == {i} for i in range(length))
+
+
+QUEUED_COMMANDS_INPUT = """\
+value 1 goes to bot 1
+value 2 goes to bot 2
+bot 1 gives low to bot 3 and high to bot 3
+bot 2 gives low to bot 3 and high to output 9
+bot 3 gives low to output 0 and high to output 1
+bot 3 gives low to output 2 and high to output 3
+bot 0 gives low to bot 1 and high to bot 2
+value 3 goes to bot 0
+value 4 goes to bot 0
+"""
+
+
+def test_queued_commands_run_depth_first() -> None:
+    # Bot 3 fires with chips 1 and 3 before bot 2 hands it chip 2
+    control = ControlRoom((1, 3))
+    control.process(parse_input(QUEUED_COMMANDS_INPUT))
+
+    assert control.action_of_interest == Action(3, ActionType.Compare, (1, 3))
+    assert {i: o.chips for i, o in control.outputs.items()} == {
+        0: {1},
+        1: {3},
+        9: {4},
+    }
+
+
+@pytest.mark.parametrize("room_type", (ControlRoom, ArrayControlRoom))
+def test_comparison_index(room_type: Callable[..., Room]) -> None:
+    control = room_type(None, record_comparisons=True)
+    control.process(parse_input(TEST_INPUT))
+
+    index = control.comparisons
+    assert len(index) == 3
+    assert index.bot_comparing(5, 2) == index.bot_comparing(2, 5) == 2
+    assert index.bot_comparing(2, 3) == 1
+    assert index.bot_comparing(3, 5) == 0
+    assert index.bot_comparing(2, 99) is None
+    assert index.comparisons_of(0) == [(3, 5)]
+    assert index.comparisons_of(42) == []
+    assert control.action_of_interest is None
+
+
+@pytest.mark.parametrize("room_type", (ControlRoom, ArrayControlRoom))
+def test_comparisons_not_recorded_by_default(room_type: Callable[..., Room]) -> None:
+    control = room_type((5, 2))
+    control.process(parse_input(TEST_INPUT))
+
+    assert control.action_of_interest == Action(2, ActionType.Compare, (2, 5))
+    with pytest.raises(ControlRoomError):
+        control.comparisons
+
+    recorded = room_type((5, 2), record_comparisons=True)
+    recorded.process(parse_input(TEST_INPUT))
+    assert recorded.action_of_interest == control.action_of_interest
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_generated_factory(seed: int) -> None:
+    data = "".join(generator.generate(50_000, seed=seed))
+    bot = next(
+        int(line.split()[-1])
+        for line in data.splitlines()
+        if line.startswith("value 61 ")
+    )
+
+    expected = solve(data)
+    assert expected[0] == bot
+    assert solve(data, room_type=ArrayControlRoom) == expected
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--max-size", type=int, default=100_000_000)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.max_size)
+        raise SystemExit(0)
+
     part_1, part_2 = solve(get_input_data(2016, 10))
     print(f"Solution part1: {part_1}")
     print(f"Solution part2: {part_2}")
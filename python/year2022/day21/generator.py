@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import random
+from itertools import count
+from typing import Iterator
+
+from support import generator_main
+
+
+def _combine(
+    rng: random.Random,
+    nodes: list[str],
+    keep: int,
+    chain: bool,
+    names: Iterator[str],
+    lines: list[str],
+) -> None:
+    # Joins nodes pairwise, appending the new monkeys, until `keep` are left
+    while len(nodes) > keep:
+        if chain:
+            lhs, rhs = nodes.pop(), nodes.pop()
+        else:
+            i = rng.randrange(len(nodes))
+            nodes[i], nodes[-1] = nodes[-1], nodes[i]
+            lhs = nodes.pop()
+            i = rng.randrange(len(nodes))
+            nodes[i], nodes[-1] = nodes[-1], nodes[i]
+            rhs = nodes.pop()
+        name = next(names)
+        lines.append(f"{name}: {lhs} {rng.choice('+-')} {rhs}")
+        nodes.append(name)
+
+
+def generate(
+    size: int, seed: int = 0, chain: bool = False, block_size: int = 1 << 16
+) -> Iterator[str]:
+    """Yields about `size` bytes of monkeys, as a random tree or as one deep chain
+
+    Only + and - are used, so every value is an integer and `humn` appears
+    linearly in the expression for root.
+
+    Monkeys are generated as subtrees of up to `block_size` number-yelling
+    monkeys each, shuffled within the subtree and yielded before the next one
+    starts. Only the subtree roots are kept until they are joined under root,
+    so memory stays bounded however large `size` is.
+    """
+    rng = random.Random(seed)
+    names = (f"m{i}" for i in count(1))
+    # Half the monkeys yell a number, half combine two others: ~17 bytes on average
+    remaining = max(size // 17 // 2, 2)
+    roots: list[str] = []
+    lines: list[str] = []
+
+    while remaining:
+        n = min(block_size, remaining)
+        remaining -= n
+        if roots:
+            nodes = []
+        else:
+            lines.append("humn: 5")
+            nodes = ["humn"]
+        while len(nodes) < n:
+            name = next(names)
+            lines.append(f"{name}: {rng.randint(1, 9)}")
+            nodes.append(name)
+
+        # A single subtree keeps both halves of root's expression
+        keep = 2 if not roots and not remaining else 1
+        _combine(rng, nodes, keep, chain, names, lines)
+        roots.extend(nodes)
+        rng.shuffle(lines)
+        yield from (f"{line}\n" for line in lines)
+        lines.clear()
+
+    _combine(rng, roots, 2, chain, names, lines)
+    lines.append(f"root: {roots[0]} + {roots[1]}")
+    rng.shuffle(lines)
+    yield from (f"{line}\n" for line in lines)
+
+
+if __name__ == "__main__":
+    raise SystemExit(generator_main(generate))
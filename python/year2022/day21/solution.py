@@ -1,20 +1,30 @@
+import argparse
 import operator
+import time
+from array import array
 from collections import defaultdict
+from collections import deque
 from collections.abc import Callable
 from collections.abc import Iterable
+from collections.abc import Sequence
+from fractions import Fraction
 from itertools import pairwise
 from typing import DefaultDict
 from typing import Literal
+from typing import NamedTuple
 from typing import TypeAlias
 from unittest.mock import ANY
 
 import pytest
 
 from support import get_input_data
+from support import import_sibling
 from support import print_solution
 from support import Solution
 from support import time_solve
 
+generator = import_sibling(__file__, "generator")
+
 YEAR = 2022
 DAY = 21
 
@@ -70,20 +80,326 @@ def calc(exp: Expression, lookup: dict[str, int]) -> int:
         return OPERATOR_FUNC_MAP[op](lookup[lhs], lookup[rhs])
 
 
+def topological_sort(expressions: dict[str, Expression]) -> list[str]:
+    """Orders monkeys so that every operand comes before its expression
+
+    Kahn's algorithm: each expression waits on its operands, and becomes ready
+    once both are ordered, which makes the whole sort O(n).
+    """
+    waiting: dict[str, int] = {}
+    dependents: DefaultDict[str, list[str]] = defaultdict(list)
+    ready: deque[str] = deque()
+
+    for key, exp in expressions.items():
+        if isinstance(exp, tuple):
+            lhs, _, rhs = exp
+            waiting[key] = 2
+            dependents[lhs].append(key)
+            dependents[rhs].append(key)
+        else:
+            ready.append(key)
+
+    topo_sorted = []
+    while ready:
+        key = ready.popleft()
+        topo_sorted.append(key)
+        for parent in dependents.get(key, ()):
+            waiting[parent] -= 1
+            if not waiting[parent]:
+                ready.append(parent)
+
+    if len(topo_sorted) != len(expressions):
+        raise ValueError("Expressions contain a cycle or an unknown operand")
+
+    return topo_sorted
+
+
+def evaluate(
+    expressions: dict[str, Expression], topo_sorted: list[str] | None = None
+) -> dict[str, int]:
+    if topo_sorted is None:
+        topo_sorted = topological_sort(expressions)
+
+    lookup: dict[str, int] = {}
+    for item in topo_sorted:
+        lookup[item] = calc(expressions[item], lookup)
+
+    return lookup
+
+
+# Op code 0 marks a constant, the others index into OP_CODE_FUNCS
+OP_CODES: dict[Operator, int] = {"+": 1, "-": 2, "*": 3, "/": 4}
+OP_CODE_FUNCS: tuple[Callable[[int, int], int], ...] = (
+    lambda a, b: 0,
+    *(OPERATOR_FUNC_MAP[op] for op in OP_CODES),
+)
+
+
+class CompiledExpressions:
+    """Monkeys interned to dense ids and laid out as parallel arrays
+
+    Ids follow topological order, so evaluation is one pass over the arrays,
+    writing into a flat list of values that starts out holding the constants.
+    """
+
+    def __init__(self, expressions: dict[str, Expression]):
+        self.names = topological_sort(expressions)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.ops = array("b")
+        self.lhs = array("q")
+        self.rhs = array("q")
+        self.constants: list[int] = []
+
+        for name in self.names:
+            exp = expressions[name]
+            if isinstance(exp, int):
+                self.ops.append(0)
+                self.lhs.append(0)
+                self.rhs.append(0)
+                self.constants.append(exp)
+            else:
+                lhs, op, rhs = exp
+                self.ops.append(OP_CODES[op])
+                self.lhs.append(self.ids[lhs])
+                self.rhs.append(self.ids[rhs])
+                self.constants.append(0)
+
+    def evaluate(self) -> list[int]:
+        values = self.constants.copy()
+        funcs = OP_CODE_FUNCS
+        for i, (op, lhs, rhs) in enumerate(zip(self.ops, self.lhs, self.rhs)):
+            if op:
+                values[i] = funcs[op](values[lhs], values[rhs])
+        return values
+
+    def to_source(self) -> str:
+        """Renders the evaluation as straight-line Python source"""
+        lines = ["def evaluate(constants):", "    v = constants.copy()"]
+        for i, (op, lhs, rhs) in enumerate(zip(self.ops, self.lhs, self.rhs)):
+            if op:
+                symbol = "//" if op == OP_CODES["/"] else "+-*"[op - 1]
+                lines.append(f"    v[{i}] = v[{lhs}] {symbol} v[{rhs}]")
+        lines.append("    return v")
+        return "\n".join(lines)
+
+    def compile_source(self) -> Callable[[], list[int]]:
+        namespace: dict[str, Callable[[list[int]], list[int]]] = {}
+        exec(compile(self.to_source(), "<monkeys>", "exec"), namespace)
+        evaluate_source = namespace["evaluate"]
+        constants = self.constants
+        return lambda: evaluate_source(constants)
+
+    def lookup(self, values: Sequence[int]) -> dict[str, int]:
+        return dict(zip(self.names, values))
+
+
+class Constraint(NamedTuple):
+    """Monkey `at` must yell `target`, or without a target, have equal operands"""
+
+    unknown: str
+    at: str = "root"
+    target: int | None = None
+
+
+class ExpressionGraph:
+    """Monkey expressions with every value cached
+
+    Changing a leaf with `set` only recomputes its ancestors, following
+    `parent_map` up to the root, i.e. O(depth) per change. If any monkey is
+    shared by several expressions, `set` falls back to a full re-evaluation.
+    """
+
+    def __init__(self, expressions: Iterable[tuple[str, Expression]]):
+        self._expressions: dict[str, Expression] = dict(expressions)
+        self._parent_map: dict[str, str] = {}
+        self._is_tree = True
+
+        for key, exp in self._expressions.items():
+            if isinstance(exp, tuple):
+                for child in exp[::2]:
+                    if child in self._parent_map:
+                        self._is_tree = False
+                    self._parent_map[child] = key
+
+        self._topo_sorted = topological_sort(self._expressions)
+        self._values = evaluate(self._expressions, self._topo_sorted)
+
+    @property
+    def expressions(self) -> dict[str, Expression]:
+        return self._expressions
+
+    @property
+    def parent_map(self) -> dict[str, str]:
+        return self._parent_map
+
+    def __getitem__(self, name: str) -> int:
+        return self._values[name]
+
+    def set(self, name: str, value: int) -> None:
+        if isinstance(self._expressions[name], tuple):
+            raise ValueError(f"Only leaf values can be set: {name}")
+
+        self._expressions[name] = value
+        if not self._is_tree:
+            self._values = evaluate(self._expressions, self._topo_sorted)
+            return
+
+        self._values[name] = value
+        while name in self._parent_map:
+            name = self._parent_map[name]
+            self._values[name] = calc(self._expressions[name], self._values)
+
+    def solve_for(
+        self,
+        unknowns: Iterable[str | tuple[str, str, int | None]],
+        target: int | None = None,
+        at: str = "root",
+    ) -> dict[str, int]:
+        """Solves each unknown leaf for a Constraint on some monkey
+
+        A plain name is solved for `at` == `target`, or without a target for
+        both operands of `at` being equal. An (unknown, at, target) tuple gives
+        the unknown its own constraint. Each unknown is solved on its own,
+        holding every other leaf at its current value. The value required of
+        each node on the way down is memoized per constraint, so path prefixes
+        shared by several unknowns are only inverted once.
+        """
+        if not self._is_tree:
+            raise ValueError("Inverse paths require every monkey to have one parent")
+
+        required_by: dict[tuple[str, int | None], dict[str, int]] = {}
+        solutions: dict[str, int] = {}
+        for item in unknowns:
+            unknown, node, goal = (
+                Constraint(item, at, target) if isinstance(item, str) else item
+            )
+            if unknown == node and goal is None:
+                raise ValueError(f"{unknown} needs a target to be solved for itself")
+            if (node, goal) not in required_by:
+                required_by[node, goal] = {} if goal is None else {node: goal}
+            required = required_by[node, goal]
+
+            # Walk up until reaching the constraint or an already inverted node
+            path = [unknown]
+            while path[-1] != node and path[-1] not in required:
+                if path[-1] not in self._parent_map:
+                    raise ValueError(f"{unknown} does not feed into {node}")
+                path.append(self._parent_map[path[-1]])
+
+            for parent, child in pairwise(reversed(path)):
+                exp = self._expressions[parent]
+                assert isinstance(exp, tuple)
+                lhs, op, rhs = exp
+                if parent == node and goal is None:
+                    required[child] = self[lhs] if rhs == child else self[rhs]
+                else:
+                    required[child] = INVERSE_FUNC_MAP[
+                        (lhs == child, op, rhs == child)
+                    ](self[lhs], self[rhs], required[parent])
+
+            solutions[unknown] = required[unknown]
+
+        return solutions
+
+    def sweep(
+        self, name: str, candidates: Iterable[int], target: str = "root"
+    ) -> Iterable[tuple[int, int]]:
+        """Yields (candidate, value of target) per candidate value of leaf `name`
+
+        The original leaf value is restored once the sweep is exhausted or closed.
+        """
+        original = self._values[name]
+        try:
+            for candidate in candidates:
+                self.set(name, candidate)
+                yield candidate, self._values[target]
+        finally:
+            self.set(name, original)
+
+
+class LinearForm(NamedTuple):
+    """An exact value of the form: a * unknown + b"""
+
+    a: Fraction
+    b: Fraction
+
+
+def combine_forms(op: Operator, x: LinearForm, y: LinearForm) -> LinearForm:
+    match op:
+        case "+":
+            return LinearForm(x.a + y.a, x.b + y.b)
+        case "-":
+            return LinearForm(x.a - y.a, x.b - y.b)
+        case "*":
+            if x.a and y.a:
+                raise ValueError("Unknown is multiplied by itself")
+            return LinearForm(x.a * y.b + y.a * x.b, x.b * y.b)
+        case "/":
+            if y.a:
+                raise ValueError("Unknown appears in a divisor")
+            return LinearForm(x.a / y.b, x.b / y.b)
+        case _:
+            raise ValueError(f"Unexpected operator: {op}")
+
+
+def linear_forms(
+    expressions: dict[str, Expression], unknown: str
+) -> dict[str, LinearForm]:
+    """Expresses every monkey as an exact linear form of the `unknown` leaf
+
+    One bottom-up pass in topological order, so shared subexpressions are only
+    computed once and any DAG works, not just trees.
+    """
+    forms: dict[str, LinearForm] = {}
+    for key in topological_sort(expressions):
+        exp = expressions[key]
+        if key == unknown:
+            forms[key] = LinearForm(Fraction(1), Fraction(0))
+        elif isinstance(exp, int):
+            forms[key] = LinearForm(Fraction(0), Fraction(exp))
+        else:
+            lhs, op, rhs = exp
+            forms[key] = combine_forms(op, forms[lhs], forms[rhs])
+
+    return forms
+
+
+def solve_linear(
+    expressions: dict[str, Expression], unknown: str = "humn", at: str = "root"
+) -> int:
+    """Solves `unknown` so that both operands of monkey `at` are equal"""
+    exp = expressions[at]
+    if not isinstance(exp, tuple):
+        raise ValueError(f"Not an expression: {at}")
+
+    forms = linear_forms(expressions, unknown)
+    lhs, _, rhs = exp
+    x, y = forms[lhs], forms[rhs]
+    if x.a == y.a:
+        raise ValueError("No unique solution")
+
+    solution = (y.b - x.b) / (x.a - y.a)
+    if solution.denominator != 1:
+        raise ValueError(f"Solution is not an integer: {solution}")
+
+    return solution.numerator
+
+
 @time_solve
 def solve(s: str) -> Solution:
-    exps = list(parse_input(s))
     # This makes various assumptions:
-    #   1. All nodes have a single parent, except for root, which does not
-    #   2. Any division operation does NOT result in fractions (both ways)
+    #   1. Part 1 divisions do NOT result in fractions, part 2 is solved exactly
+    #   2. The unknown only appears linearly in the expression for root
     #   3. All expressions := lhs <OP> rhs | <NUMBER>
-    expressions: dict[str, Expression] = {}
-    lookup: dict[str, int] = {}
+    expressions = dict(parse_input(s))
+    return evaluate(expressions)["root"], solve_linear(expressions)
+
+
+def _topological_sort_rescan(expressions: dict[str, Expression]) -> list[str]:
+    # The original approach, which rescans every node each round: O(n^2)
     parent_map: dict[str, str] = {}
     children_map: DefaultDict[str, Children] = defaultdict(tuple)
-
-    for key, exp in exps:
-        expressions[key] = exp
+    for key, exp in expressions.items():
         children_map[key] = ()
         if isinstance(exp, tuple):
             lhs, _, rhs = exp
@@ -92,13 +408,8 @@ def solve(s: str) -> Solution:
             parent_map[rhs] = key
 
     topo_sorted = []
-
     while children_map:
-        childless = set()
-        for parent, children in children_map.items():
-            if len(children) == 0:
-                childless.add(parent)
-
+        childless = [p for p, children in children_map.items() if not children]
         for c in childless:
             topo_sorted.append(c)
             parent = parent_map.get(c)
@@ -108,39 +419,66 @@ def solve(s: str) -> Solution:
                     children_map[parent] = ()
                 elif len(siblings) == 2:
                     a, b = siblings
-                    if a == c:
-                        children_map[parent] = (b,)
-                    else:
-                        children_map[parent] = (a,)
-                else:
-                    # Should not get here ever
-                    pass
+                    children_map[parent] = (b,) if a == c else (a,)
             del children_map[c]
 
-    for item in topo_sorted:
-        lookup[item] = calc(expressions[item], lookup)
-
-    node_to_solve = "humn"
-    path_with_node_to_solve = [node_to_solve]
-
-    while node_to_solve in parent_map:
-        node_to_solve = parent_map[node_to_solve]
-        path_with_node_to_solve.append(node_to_solve)
-
-    path_with_node_to_solve.reverse()
-
-    curr_value = 0
-
-    for parent, child in pairwise(path_with_node_to_solve):
-        lhs, op, rhs = expressions[parent]
-        if parent == "root":
-            curr_value = lookup[lhs] if rhs == child else lookup[rhs]
-        else:
-            curr_value = INVERSE_FUNC_MAP[(lhs == child, op, rhs == child)](
-                lookup[lhs], lookup[rhs], curr_value
+    return topo_sorted
+
+
+def _generated(size: int, chain: bool = False) -> dict[str, Expression]:
+    return dict(parse_input("".join(generator.generate(size, chain=chain))))
+
+
+def benchmark_sort(max_size: int) -> None:
+    size = 100_000
+    while size <= max_size:
+        for chain in (False, True):
+            expressions = _generated(size, chain=chain)
+            n = len(expressions)
+            sorts = [("kahn", topological_sort)]
+            if n <= 20_000:
+                sorts.append(("rescan", _topological_sort_rescan))
+            for name, f in sorts:
+                before = time.perf_counter()
+                f(expressions)
+                elapsed = time.perf_counter() - before
+                shape = "chain" if chain else "tree"
+                print(f"> {n:>9,} {shape:>5} {name:>6}: {elapsed * 1000:9.1f} ms")
+        size *= 10
+
+
+def benchmark_evaluate(max_size: int) -> None:
+    size = 100_000
+    while size <= max_size:
+        expressions = _generated(size)
+        n = len(expressions)
+        topo_sorted = topological_sort(expressions)
+
+        before = time.perf_counter()
+        compiled = CompiledExpressions(expressions)
+        compile_time = time.perf_counter() - before
+        before = time.perf_counter()
+        evaluate_source = compiled.compile_source()
+        source_time = time.perf_counter() - before
+
+        for name, f, setup in (
+            ("dict", lambda: evaluate(expressions, topo_sorted), 0.0),
+            ("arrays", compiled.evaluate, compile_time),
+            ("source", evaluate_source, compile_time + source_time),
+        ):
+            before = time.perf_counter()
+            f()
+            elapsed = time.perf_counter() - before
+            print(
+                f"> {n:>9,} {name:>6}: {elapsed * 1000:9.1f} ms"
+                f" (+{setup * 1000:.1f} ms compile)"
             )
+        size *= 10
+
 
-    return lookup["root"], curr_value
+def benchmark(max_size: int = 30_000_000) -> None:
+    benchmark_sort(max_size)
+    benchmark_evaluate(max_size)
 
 
 TEST_INPUT = """\
@@ -170,5 +508,162 @@ def test_solve(input_s: str, expected: str):
     assert solve(input_s) == (*expected, ANY)
 
 
+@pytest.mark.parametrize("chain", (False, True))
+def test_topological_sort(chain: bool) -> None:
+    data = "".join(generator.generate(28_000, seed=3, chain=chain))
+    expressions = dict(parse_input(data))
+    order = topological_sort(expressions)
+    position = {key: i for i, key in enumerate(order)}
+
+    assert sorted(order) == sorted(expressions)
+    for key, exp in expressions.items():
+        if isinstance(exp, tuple):
+            lhs, _, rhs = exp
+            assert position[lhs] < position[key] and position[rhs] < position[key]
+
+    rescan = _topological_sort_rescan(expressions)
+    assert evaluate(expressions) == evaluate(expressions, rescan)
+
+
+@pytest.mark.parametrize("chain", (False, True))
+@pytest.mark.parametrize("block_size", (1, 2, 7, 100))
+def test_generated_in_blocks(chain: bool, block_size: int) -> None:
+    lines = list(generator.generate(5_000, seed=2, chain=chain, block_size=block_size))
+    expressions = dict(parse_input("".join(lines)))
+    operands = [
+        name
+        for exp in expressions.values()
+        if isinstance(exp, tuple)
+        for name in (exp[0], exp[2])
+    ]
+
+    # One tree: every monkey but root is the operand of exactly one other monkey
+    assert len(expressions) == len(lines)
+    assert sorted(operands + ["root"]) == sorted(expressions)
+    graph = ExpressionGraph(expressions.items())
+    assert graph.solve_for(["humn"]) == {"humn": solve_linear(expressions)}
+
+
+def test_expression_graph_set() -> None:
+    graph = ExpressionGraph(parse_input(TEST_INPUT))
+    assert graph["root"] == 152
+
+    graph.set("humn", 301)
+    assert graph["pppw"] == graph["sjmn"] == 150
+    assert graph["root"] == evaluate(graph.expressions)["root"] == 300
+
+    with pytest.raises(ValueError):
+        graph.set("root", 1)
+
+
+@pytest.mark.parametrize("shared", (False, True))
+def test_expression_graph_sweep(shared: bool) -> None:
+    input_s = TEST_INPUT
+    if shared:
+        input_s = input_s.replace("dbpl: 5", "dbpl: lfqf + ljgn")
+    graph = ExpressionGraph(parse_input(input_s))
+    before = graph["root"]
+
+    for candidate, root in graph.sweep("humn", range(0, 1000, 37)):
+        expressions = dict(parse_input(input_s))
+        expressions["humn"] = candidate
+        assert root == evaluate(expressions)["root"]
+
+    assert graph["root"] == before
+
+
+def test_expression_graph_solve_for() -> None:
+    graph = ExpressionGraph(parse_input(TEST_INPUT))
+    unknowns = ["humn", "dvpt", "ljgn", "sllz"]
+    solutions = graph.solve_for(unknowns)
+    assert solutions == {"humn": 301, "dvpt": -293, "ljgn": 298, "sllz": 596}
+
+    for name, value in solutions.items():
+        original = graph[name]
+        graph.set(name, value)
+        assert graph["pppw"] == graph["sjmn"]
+        graph.set(name, original)
+
+    assert graph.solve_for(["humn", "hmdt"], target=152) == {"humn": 5, "hmdt": 32}
+    assert graph.solve_for(["humn"], target=6, at="cczh") == {"humn": 4}
+
+    with pytest.raises(ValueError):
+        graph.solve_for(["hmdt"], at="cczh")
+    with pytest.raises(ValueError):
+        graph.solve_for(["root"])
+
+
+def test_expression_graph_solve_for_constraints() -> None:
+    graph = ExpressionGraph(parse_input(TEST_INPUT))
+    constraints: list[str | tuple[str, str, int | None]] = [
+        Constraint("humn", "cczh", 6),
+        ("ljgn", "lgvd", 10),
+        ("sllz", "cczh", 6),
+        "dvpt",
+    ]
+    solutions = graph.solve_for(constraints)
+    assert solutions == {"humn": 4, "ljgn": 5, "sllz": 2, "dvpt": -293}
+    assert graph.solve_for([Constraint("humn", target=152)]) == {"humn": 5}
+    assert graph.solve_for([("root", "root", 7)]) == {"root": 7}
+
+
+@pytest.mark.parametrize(
+    "input_s",
+    (TEST_INPUT, "".join(generator.generate(42_000, seed=5))),
+    ids=("test", "gen"),
+)
+def test_compiled_expressions(input_s: str) -> None:
+    expressions = dict(parse_input(input_s))
+    expected = evaluate(expressions)
+    compiled = CompiledExpressions(expressions)
+
+    assert compiled.lookup(compiled.evaluate()) == expected
+    assert compiled.lookup(compiled.compile_source()()) == expected
+
+
+def test_solve_linear_shared_subexpressions() -> None:
+    input_s = """\
+root: twice + ten
+twice: half + half
+half: shared / two
+shared: humn + humn
+two: 2
+ten: 10
+humn: 0
+"""
+    expressions = dict(parse_input(input_s))
+    assert solve_linear(expressions) == 5
+    assert solve_linear(dict(parse_input(TEST_INPUT))) == 301
+
+
+@pytest.mark.parametrize(
+    ("patch", "match"),
+    (
+        (("sllz", ("humn", "*", "lgvd")), "multiplied"),
+        (("pppw", ("dbpl", "/", "cczh")), "divisor"),
+        (("root", ("humn", "-", "humn")), "unique"),
+    ),
+)
+def test_solve_linear_errors(patch: tuple[str, Expression], match: str) -> None:
+    expressions = dict(parse_input(TEST_INPUT))
+    key, exp = patch
+    expressions[key] = exp
+    with pytest.raises(ValueError, match=match):
+        solve_linear(expressions)
+
+
+def test_topological_sort_cycle() -> None:
+    with pytest.raises(ValueError):
+        topological_sort({"a": ("b", "+", "c"), "b": ("a", "+", "c"), "c": 1})
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bench", action="store_true")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark()
+        raise SystemExit(0)
+
     print_solution(solve(get_input_data(YEAR, DAY)))
@@ -2,43 +2,428 @@ from __future__ import annotations
 
 import argparse
 import contextlib
+import functools
+import importlib.util
+import inspect
+import json
+import math
 import os
+import platform
+import re
+import statistics
+import sys
 import time
+import tracemalloc
 import urllib.error
 import urllib.request
+from types import ModuleType
+from typing import Any
+from typing import Callable
 from typing import Generator
+from typing import Iterable
+from typing import NamedTuple
+from typing import TypeVar
+from typing import Union
+from typing import overload
+
+Solution = tuple[Union[int, str], ...]
+
+T = TypeVar("T")
+
+
+def _format_ns(ns: float) -> str:
+    for unit, scale in (("s", 1e9), ("ms", 1e6), ("μs", 1e3)):
+        if ns >= scale:
+            return f"{ns / scale:.3g} {unit}"
+    return f"{ns:.3g} ns"
+
+
+def _format_bytes(n: int) -> str:
+    for unit, scale in (("GiB", 1 << 30), ("MiB", 1 << 20), ("KiB", 1 << 10)):
+        if n >= scale:
+            return f"{n / scale:.3g} {unit}"
+    return f"{n} B"
 
 
 @contextlib.contextmanager
 def timing(name: str = "") -> Generator[None, None, None]:
-    before = time.time()
+    before = time.perf_counter_ns()
     try:
         yield
     finally:
-        after = time.time()
-        t = (after - before) * 1000
-        unit = "ms"
-        if t < 100:
-            t *= 1000
-            unit = "μs"
+        elapsed = time.perf_counter_ns() - before
         if name:
             name = f" ({name})"
-        print(f"> {int(t)} {unit}{name}")
+        print(f"> {_format_ns(elapsed)}{name}")
 
 
-def get_input_data(year: int, day: int, relative_dir: str | None = None) -> str:
+class TimingStats(NamedTuple):
+    """Wall clock statistics (in nanoseconds) over `runs` timed calls
+
+    `peak_bytes` is the peak traced allocation of one extra, untimed call, or
+    None if memory was not measured.
+    """
+
+    runs: int
+    min_ns: int
+    median_ns: float
+    p95_ns: int
+    peak_bytes: int | None = None
+
+    @classmethod
+    def from_samples(
+        cls, samples: list[int], peak_bytes: int | None = None
+    ) -> TimingStats:
+        ordered = sorted(samples)
+        # Nearest-rank percentile, so p95 is always an observed sample
+        p95 = ordered[max(math.ceil(0.95 * len(ordered)) - 1, 0)]
+        return cls(
+            len(ordered), ordered[0], statistics.median(ordered), p95, peak_bytes
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return self._asdict()
+
+    def __str__(self) -> str:
+        s = (
+            f"min {_format_ns(self.min_ns)}, median {_format_ns(self.median_ns)}, "
+            f"p95 {_format_ns(self.p95_ns)} over {self.runs} run(s)"
+        )
+        if self.peak_bytes is not None:
+            s += f", peak {_format_bytes(self.peak_bytes)}"
+        return s
+
+
+def _peak_memory(func: Callable[..., Any], *args: Any, **kwargs: Any) -> int:
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+
+
+def _measure(
+    func: Callable[..., T],
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+    repeat: int,
+    warmup: int,
+    memory: bool,
+) -> tuple[T, TimingStats]:
+    if repeat < 1:
+        raise ValueError(f"repeat must be at least 1, got {repeat}")
+
+    for _ in range(warmup):
+        func(*args, **kwargs)
+
+    samples: list[int] = []
+    for _ in range(repeat):
+        before = time.perf_counter_ns()
+        result = func(*args, **kwargs)
+        samples.append(time.perf_counter_ns() - before)
+
+    # tracemalloc slows allocations down a lot, so it gets a run of its own
+    peak = _peak_memory(func, *args, **kwargs) if memory else None
+    return result, TimingStats.from_samples(samples, peak)
+
+
+def benchmark(
+    func: Callable[..., Any],
+    *args: Any,
+    repeat: int = 5,
+    warmup: int = 1,
+    memory: bool = False,
+    **kwargs: Any,
+) -> TimingStats:
+    """Times `func(*args, **kwargs)` and returns its statistics"""
+    return _measure(func, args, kwargs, repeat, warmup, memory)[1]
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return default if value is None or value == "" else int(value)
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.lower() not in ("0", "false", "no")
+
+
+@overload
+def time_solve(func: Callable[..., Solution]) -> Callable[..., tuple[Any, ...]]:
+    ...
+
+
+@overload
+def time_solve(
+    *,
+    repeat: int | None = None,
+    warmup: int | None = None,
+    memory: bool | None = None,
+) -> Callable[[Callable[..., Solution]], Callable[..., tuple[Any, ...]]]:
+    ...
+
+
+def time_solve(
+    func: Callable[..., Solution] | None = None,
+    *,
+    repeat: int | None = None,
+    warmup: int | None = None,
+    memory: bool | None = None,
+) -> Any:
+    """Times a solve function, appending its TimingStats to the returned parts
+
+    Usable bare (`@time_solve`) or with arguments (`@time_solve(repeat=10)`).
+    Settings not given fall back to $AOC_REPEAT, $AOC_WARMUP and $AOC_MEMORY,
+    then to a single cold run without memory tracing. The undecorated function
+    stays available as `__wrapped__`.
+    """
+
+    def decorator(f: Callable[..., Solution]) -> Callable[..., tuple[Any, ...]]:
+        @functools.wraps(f)
+        def wrapper(*args: Any, **kwargs: Any) -> tuple[Any, ...]:
+            result, stats = _measure(
+                f,
+                args,
+                kwargs,
+                repeat if repeat is not None else _env_int("AOC_REPEAT", 1),
+                warmup if warmup is not None else _env_int("AOC_WARMUP", 0),
+                memory if memory is not None else _env_flag("AOC_MEMORY", False),
+            )
+            return (*result, stats)
+
+        wrapper.__time_solve__ = True  # type: ignore[attr-defined]
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def print_solution(result: tuple[Any, ...], as_json: bool | None = None) -> None:
+    """Prints each part of a solution, plus its timings if it has any
+
+    With `as_json` (default: $AOC_JSON) a single JSON object is printed instead.
+    """
+    stats: TimingStats | None = None
+    if result and isinstance(result[-1], TimingStats):
+        *parts, stats = result
+    else:
+        parts = list(result)
+
+    if as_json is None:
+        as_json = _env_flag("AOC_JSON", False)
+
+    if as_json:
+        print(
+            json.dumps(
+                {
+                    "parts": parts,
+                    "timing": stats.to_dict() if stats is not None else None,
+                }
+            )
+        )
+        return
+
+    for i, part in enumerate(parts, 1):
+        print(f"Solution part {i}: {part}")
+    if stats is not None:
+        print(f"> {stats}")
+
+
+def get_input_path(year: int, day: int, relative_dir: str | None = None) -> str:
     file_name = f"day{day:02}.txt"
     file_dir = f"{year}"
 
     if relative_dir is None:
         relative_dir = "./../../../inputs/"
 
-    file_path = os.path.join(relative_dir, file_dir, file_name)
+    return os.path.join(relative_dir, file_dir, file_name)
 
-    with open(file_path) as f:
+
+def get_input_data(year: int, day: int, relative_dir: str | None = None) -> str:
+    with open(get_input_path(year, day, relative_dir)) as f:
         return f.read()
 
 
+def _load_module(path: str, module_name: str) -> ModuleType:
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load {path}")
+    module = importlib.util.module_from_spec(spec)
+    # Registered so that e.g. worker processes can unpickle its functions
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
+
+
+def import_sibling(file: str, name: str) -> ModuleType:
+    """Imports the module `name` that lives next to `file`
+
+    Solutions run both as scripts and as pytest modules, where a plain
+    `import generator` only works in one of the two.
+    """
+    directory = os.path.dirname(os.path.abspath(file))
+    parent, day_dir = os.path.split(directory)
+    module_name = f"{os.path.basename(parent)}_{day_dir}_{name}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    return _load_module(os.path.join(directory, f"{name}.py"), module_name)
+
+
+SIZE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*([kmg]i?)?b?", re.IGNORECASE)
+SIZE_UNITS = {
+    "": 1,
+    "k": 10**3,
+    "m": 10**6,
+    "g": 10**9,
+    "ki": 1 << 10,
+    "mi": 1 << 20,
+    "gi": 1 << 30,
+}
+
+
+def parse_size(s: str) -> int:
+    """Parses a byte count such as 4096, 64k, 1.5MB or 2GiB"""
+    match = SIZE_RE.fullmatch(s.strip())
+    if match is None:
+        raise ValueError(f"Invalid size: {s!r}")
+    return int(float(match[1]) * SIZE_UNITS[(match[2] or "").lower()])
+
+
+def generator_main(generate: Callable[[int, int], Iterable[str]]) -> int:
+    """Command line for a puzzle generator, writing its output to a file or stdout"""
+    parser = argparse.ArgumentParser(description="Generate puzzle input")
+    parser.add_argument("size", type=parse_size, help="e.g. 64k, 10MB or 1GiB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="defaults to stdout")
+    args = parser.parse_args()
+
+    if args.output is None:
+        sys.stdout.writelines(generate(args.size, args.seed))
+        return 0
+
+    with open(args.output, "w") as f:
+        f.writelines(generate(args.size, args.seed))
+    print(f"Wrote {_format_bytes(os.path.getsize(args.output))} to {args.output}")
+    return 0
+
+
+def _default_cache_dir() -> str:
+    if "AOC_CACHE_DIR" in os.environ:
+        return os.environ["AOC_CACHE_DIR"]
+    xdg_cache = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(xdg_cache, "aoc")
+
+
+class HitCache:
+    """Persists the hits of a brute-force search between runs
+
+    Entries are keyed by a search key (e.g. a door id) and a predicate name, and
+    record every hit found so far plus the point up to which the search space has
+    been fully scanned. Each puzzle gets its own JSON file, holding at most
+    `max_entries` entries; the least recently used ones are evicted first.
+
+    With `refresh=True` existing entries are ignored (and overwritten on store).
+    """
+
+    def __init__(
+        self,
+        year: int,
+        day: int,
+        cache_dir: str | None = None,
+        max_entries: int = 32,
+        refresh: bool = False,
+    ):
+        if cache_dir is None:
+            cache_dir = _default_cache_dir()
+
+        self._path = os.path.join(cache_dir, f"{year}", f"day{day:02}.json")
+        self._max_entries = max_entries
+        self._refresh = refresh
+        # Reads only note the access; it reaches the file with the next store
+        self._accessed: dict[str, float] = {}
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            with open(self._path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, entries: dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self._path)
+
+    def load(self, key: str, predicate: str) -> tuple[list[tuple[int, str]], int]:
+        """Returns the cached hits and the first position not yet scanned"""
+        if self._refresh:
+            return [], 0
+
+        entry = self._read().get(f"{key}|{predicate}")
+        if entry is None:
+            return [], 0
+
+        self._accessed[f"{key}|{predicate}"] = time.time()
+        return [(n, value) for n, value in entry["hits"]], entry["scanned"]
+
+    def store(
+        self, key: str, predicate: str, hits: list[tuple[int, str]], scanned: int
+    ) -> None:
+        entries = self._read()
+        for accessed_key, accessed in self._accessed.items():
+            if accessed_key in entries:
+                entries[accessed_key]["accessed"] = accessed
+        self._accessed.clear()
+
+        entries[f"{key}|{predicate}"] = {
+            "hits": hits,
+            "scanned": scanned,
+            "accessed": time.time(),
+        }
+
+        while len(entries) > self._max_entries:
+            oldest = min(entries, key=lambda k: entries[k]["accessed"])
+            del entries[oldest]
+
+        self._write(entries)
+
+    def invalidate(self, key: str | None = None, predicate: str | None = None) -> None:
+        """Drops matching entries, or the whole puzzle cache if no filter is given"""
+        if key is None and predicate is None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._path)
+            return
+
+        entries = {
+            k: v
+            for k, v in self._read().items()
+            if not (
+                (key is None or k.split("|", 1)[0] == key)
+                and (predicate is None or k.split("|", 1)[1] == predicate)
+            )
+        }
+        self._write(entries)
+
+
 def get_input(year: int, day: int) -> str:
     with open("./.env") as f:
         contents = f.read()
@@ -78,3 +463,186 @@ def download_input() -> int:
         print("...")
 
     return 0
+
+
+SOLUTION_PATH_RE = re.compile(r"year(\d{4})[/\\]day(\d{2})[/\\]solution\.py$")
+
+# Tried in order; the first group the module fully defines is benchmarked
+ENTRY_POINTS = (("solve",), ("part_1_2",), ("parts_1_2",), ("part1", "part2"))
+
+
+def discover_solutions(root: str = ".") -> list[tuple[int, int, str]]:
+    """Returns (year, day, path) for every python/yearYYYY/dayNN/solution.py"""
+    found = []
+    python_dir = os.path.join(root, "python")
+    for dirpath, _, filenames in os.walk(python_dir):
+        if "solution.py" not in filenames:
+            continue
+        path = os.path.join(dirpath, "solution.py")
+        match = SOLUTION_PATH_RE.search(path)
+        if match:
+            found.append((int(match[1]), int(match[2]), path))
+
+    return sorted(found)
+
+
+def _load_solution(year: int, day: int, path: str) -> ModuleType:
+    return _load_module(path, f"aoc_{year}_day{day:02}")
+
+
+def _entry_points(module: ModuleType) -> list[tuple[str, Callable[..., Any]]]:
+    for names in ENTRY_POINTS:
+        funcs: list[Callable[..., Any]] = []
+        for name in names:
+            f = getattr(module, name, None)
+            if not callable(f):
+                break
+            # Time the bare function, not its own time_solve wrapper
+            funcs.append(f.__wrapped__ if getattr(f, "__time_solve__", False) else f)
+        else:
+            return list(zip(names, funcs))
+
+    return []
+
+
+def _entry_input(func: Callable[..., Any], s: str) -> str:
+    # Solutions taking the raw input name it `s`; the others (e.g. a door id)
+    # take a single token and must not see the trailing newline
+    params = list(inspect.signature(func).parameters)
+    return s if params and params[0] == "s" else s.strip()
+
+
+class BenchResult(NamedTuple):
+    puzzle: str
+    entry: str
+    stats: TimingStats
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"puzzle": self.puzzle, "entry": self.entry, **self.stats.to_dict()}
+
+
+def run_benchmarks(
+    root: str = ".",
+    years: list[int] | None = None,
+    days: list[int] | None = None,
+    repeat: int = 5,
+    warmup: int = 1,
+    memory: bool = True,
+) -> Generator[BenchResult, None, None]:
+    """Benchmarks every discovered solution that has a matching input file"""
+    for year, day, path in discover_solutions(root):
+        if (years and year not in years) or (days and day not in days):
+            continue
+
+        puzzle = f"{year}/day{day:02}"
+        input_path = get_input_path(year, day, os.path.join(root, "inputs"))
+        if not os.path.exists(input_path):
+            print(f"{puzzle}: skipped, no input at {input_path}")
+            continue
+
+        with open(input_path) as f:
+            s = f.read()
+
+        entries = _entry_points(_load_solution(year, day, path))
+        if not entries:
+            print(f"{puzzle}: skipped, no solve/part1/part2 entry point")
+            continue
+
+        for name, func in entries:
+            stats = benchmark(
+                func, _entry_input(func, s), repeat=repeat, warmup=warmup, memory=memory
+            )
+            yield BenchResult(puzzle, name, stats)
+
+
+def _read_baseline(path: str) -> dict[str, dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _regressions(
+    result: BenchResult, baseline: dict[str, Any] | None, threshold: float
+) -> list[str]:
+    if baseline is None:
+        return []
+
+    found = []
+    limit = 1 + threshold
+    if result.stats.median_ns > baseline["median_ns"] * limit:
+        found.append(
+            f"median {_format_ns(baseline['median_ns'])}"
+            f" -> {_format_ns(result.stats.median_ns)}"
+        )
+    peak, baseline_peak = result.stats.peak_bytes, baseline.get("peak_bytes")
+    if peak is not None and baseline_peak and peak > baseline_peak * limit:
+        found.append(f"peak {_format_bytes(baseline_peak)} -> {_format_bytes(peak)}")
+
+    return found
+
+
+def bench() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark every solution and compare against a baseline"
+    )
+    parser.add_argument("--root", default=".", help="repository root")
+    parser.add_argument("--year", type=int, action="append", dest="years")
+    parser.add_argument("--day", type=int, action="append", dest="days")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="relative slowdown that counts as a regression (default: %(default)s)",
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--results-dir", help="where results are kept (default: ROOT/.aoc-bench)"
+    )
+    args = parser.parse_args()
+
+    results_dir = args.results_dir or os.path.join(args.root, ".aoc-bench")
+    baseline_path = os.path.join(results_dir, "baseline.json")
+    baseline = _read_baseline(baseline_path)
+    os.makedirs(results_dir, exist_ok=True)
+
+    run = {"timestamp": time.time(), "python": platform.python_version()}
+    regressed = []
+    current = {}
+
+    with open(os.path.join(results_dir, "results.jsonl"), "a") as f:
+        for result in run_benchmarks(
+            args.root,
+            args.years,
+            args.days,
+            repeat=args.repeat,
+            warmup=args.warmup,
+            memory=not args.no_memory,
+        ):
+            key = f"{result.puzzle}:{result.entry}"
+            current[key] = result.to_dict()
+            f.write(json.dumps({**run, **current[key]}) + "\n")
+            f.flush()
+
+            problems = _regressions(result, baseline.get(key), args.threshold)
+            status = f"REGRESSION ({'; '.join(problems)})" if problems else "ok"
+            if key not in baseline:
+                status = "new"
+            print(f"{key:<28} {result.stats}  {status}")
+            if problems:
+                regressed.append(key)
+
+    if args.save_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump({**baseline, **current}, f, indent=2, sort_keys=True)
+        print(f"Saved baseline for {len(current)} entry point(s) to {baseline_path}")
+
+    if regressed:
+        print(f"{len(regressed)} regression(s) above {args.threshold:.0%}")
+        return 1
+
+    return 0